@@ -0,0 +1,184 @@
+# bench/mock_server.py
+"""
+Local stand-in for OpenWeather's /data/2.5/weather (and /group).
+Why: benchmarks must not depend on the network, an API key, or quota -- and
+need knobs the real service doesn't give us (latency, errors, throttling).
+
+Knobs: base latency + random jitter (ms), a fraction of 500s, a fraction of
+429s (with Retry-After), a fraction of stragglers that take --slow-ms
+longer (the tail hedged requests are for). Names starting with "nowhere" answer 404, like a typo.
+Answers carry an ETag + Last-Modified; a matching If-None-Match gets a 304.
+Point the CLI at it with OPENWEATHER_URL=http://127.0.0.1:<port>/data/2.5
+
+    python bench/mock_server.py --port 8765 --latency 50 --jitter 20 --rate-429 0.05
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse, json, random, threading, time, zlib
+
+
+def _city_id(name: str) -> int:
+    return zlib.crc32(name.strip().lower().encode()) % 10_000_000 + 1
+
+
+def _item(city_id: int, name: str) -> dict:
+    """Just enough of OpenWeather's answer for normalize_response()."""
+    return {
+        "id": city_id,
+        "name": name,
+        "main": {"temp": 10.5, "feels_like": 9.0, "humidity": 50},
+        "weather": [{"description": "clear sky"}],
+    }
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 1024  # the default 5 stalls bursts on SYN retries
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients dropping idle keep-alive sockets is normal here
+
+
+class MockServer:
+    """Threaded HTTP server with injectable latency/errors. Usable as a context manager."""
+
+    def __init__(self, port: int = 0, latency_ms: float = 20, jitter_ms: float = 10,
+                 error_rate: float = 0.0, rate_429: float = 0.0, retry_after: float = 1.0,
+                 seed: int = 0, slow_rate: float = 0.0, slow_ms: float = 2000):
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.slow_rate, self.slow_ms = slow_rate, slow_ms
+        self.error_rate, self.rate_429, self.retry_after = error_rate, rate_429, retry_after
+        self.stats = {"requests": 0, "weather": 0, "group": 0, "429": 0, "5xx": 0, "404": 0, "304": 0,
+                      "slow": 0}
+        self.started = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())
+        self._names = {}  # id -> name, so id= lookups answer with the name first seen
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+        self.httpd = _Server(("127.0.0.1", port), self._handler())
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}/data/2.5"
+        self._thread = None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+            # headers and body go out in two writes: with Nagle on, every reused
+            # connection would wait ~40 ms on the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, body, headers = server.answer(self.path)
+                data = json.dumps(body).encode()
+                if status == 200:
+                    etag = f'"{zlib.crc32(data):08x}"'
+                    headers = {**headers, "ETag": etag, "Last-Modified": server.started}
+                    if self.headers.get("If-None-Match") == etag:
+                        server._count("304")
+                        status, data = 304, b""
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                if status != 304:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def answer(self, path: str):
+        """(status, json body, extra headers) for one request; sleeps for the latency."""
+        u = urlparse(path)
+        q = parse_qs(u.query)
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self._rng.random()
+            delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+            if self._rng.random() < self.slow_rate:
+                self.stats["slow"] += 1
+                delay += self.slow_ms
+        time.sleep(delay / 1000)
+
+        if roll < self.rate_429:
+            self._count("429")
+            return 429, {"cod": 429, "message": "rate limited"}, {"Retry-After": str(self.retry_after)}
+        if roll < self.rate_429 + self.error_rate:
+            self._count("5xx")
+            return 500, {"cod": 500, "message": "injected error"}, {}
+
+        if u.path.endswith("/group"):
+            self._count("group")
+            ids = [int(x) for x in q.get("id", [""])[0].split(",") if x]
+            items = [_item(i, self._names.get(i, f"City {i}")) for i in ids]
+            return 200, {"cnt": len(items), "list": items}, {}
+
+        self._count("weather")
+        if "id" in q:
+            i = int(q["id"][0])
+            return 200, _item(i, self._names.get(i, f"City {i}")), {}
+        name = q.get("q", [""])[0].split(",")[0].strip()
+        if not name or name.lower().startswith("nowhere"):
+            self._count("404")
+            return 404, {"cod": "404", "message": "city not found"}, {}
+        city_id = _city_id(name)
+        self._names.setdefault(city_id, name)
+        return 200, _item(city_id, name), {}
+
+    def _count(self, k):
+        with self._lock:
+            self.stats[k] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-openweather", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_args(p: argparse.ArgumentParser):
+    p.add_argument("--latency", type=float, default=20, help="Base latency per request, ms (default 20).")
+    p.add_argument("--jitter", type=float, default=10, help="Extra random latency 0..N ms (default 10).")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 500.")
+    p.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered 429.")
+    p.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s.")
+    p.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests that straggle.")
+    p.add_argument("--slow-ms", type=float, default=2000, help="Extra latency of a straggler, ms (default 2000).")
+
+
+def from_args(args, port: int = 0) -> MockServer:
+    return MockServer(port, args.latency, args.jitter, args.error_rate, args.rate_429, args.retry_after,
+                      slow_rate=args.slow_rate, slow_ms=args.slow_ms)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Local OpenWeather stand-in for benchmarks.")
+    p.add_argument("--port", type=int, default=8765)
+    add_args(p)
+    args = p.parse_args()
+    server = from_args(args, args.port)
+    print(f"serving {server.url} (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.snapshot()))
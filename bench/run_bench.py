@@ -0,0 +1,549 @@
+# bench/run_bench.py
+"""
+Offline benchmark suite: every scenario runs against bench/mock_server.py.
+Why: "is it faster?" needs numbers we can compare run to run, without the
+network, an API key, or burning quota.
+
+Each (scenario, size) runs in a fresh child process, so peak RSS is that
+scenario's alone and caches/pools never leak between runs. Output is one
+JSON document (throughput, p50/p95/p99 latency, peak RSS, mock-server
+counters); --baseline compares against an earlier one and exits 1 on a
+regression.
+
+    python bench/run_bench.py --sizes 10,100,1000 --out bench/results.json
+    python bench/run_bench.py --scenarios thread,async --rate-429 0.05 --baseline bench/results.json
+
+What one "op" is (what latency is measured over):
+- fetch_raw                        one fetch_raw() call on one session
+- sequential/thread/async/group    one city, from being read off the input to its answer
+- hedge                            same as thread, with --hedge p95 (5% budget); try --slow-rate
+- main, cache_day_cold/_warm       one output line of weather_cli.main() (--cache-day twice)
+- csv_append, csv_dedupe           one WeatherLog.append() (second pass: all duplicates)
+- csv_batch                        one append_many() of CSV_BATCH rows
+- chart_full, chart_cached         one chart_weather.main() over size*100 log rows
+- chart_load                       one chart_weather.load_series() over size*2000 log rows
+                                   (2,000,000 at size 1000; its peak RSS is the loader's)
+- history                          one HistoryIndex.summary() over size*100 log rows spanning
+                                   two year ends; fails the run if any differs from a
+                                   brute-force scan (ranges mid-month, on month edges, across
+                                   a year boundary, open-ended)
+- startup_import                   `import week2.weather_cli`, as -X importtime reports it
+- startup_version, startup_help    one `python -m week2.weather_cli --version` / `--help`
+- startup_python                   one bare `python -c pass` (the floor under the two above)
+  (startup ignores --sizes; it fails the run if importing the CLI loads any of HEAVY)
+"""
+from contextlib import redirect_stdout
+from pathlib import Path
+import argparse, csv, datetime, io, json, math, os, platform, subprocess, sys, tempfile, time
+
+try:
+    import resource  # not on Windows: peak RSS is reported as null there
+except ImportError:
+    resource = None
+
+REPO = Path(__file__).resolve().parents[1]
+UNITS = "metric"
+TIMEOUT = 10
+CHART_CITIES = 5
+CHART_ROWS_PER_SIZE = 100
+LOAD_CITIES = 1000
+LOAD_ROWS_PER_SIZE = 2000
+HISTORY_CITIES = 3
+HISTORY_START, HISTORY_DAYS = datetime.datetime(2023, 11, 1), 800  # to 2026-01-09
+HISTORY_CONDITIONS = ("clear sky", "light rain", "overcast clouds", "")
+# (from, to): mid-month, exactly whole months, month edges, year ends, open-ended
+HISTORY_RANGES = [
+    ("2024-01-15", "2024-03-10"), ("2024-02-03", "2024-02-20"), ("2024-01-15", "2024-02-29"),
+    ("2024-02-01", "2024-04-30"), ("2024-02-01", "2024-02-29"), ("2024-03-31", "2024-04-01"),
+    ("2024-03-01", "2024-03-01"), ("2023-12-20", "2024-01-10"), ("2023-12-31", "2024-01-01"),
+    ("2024-12-01", "2025-01-31"), ("2024-11-15", "2025-02-14"), ("2023-12-01", "2024-12-31"),
+    (None, "2024-06-15"), ("2024-06-15", None), (None, None), ("2022-01-01", "2023-10-31"),
+]
+
+NETWORK = ["fetch_raw", "sequential", "thread", "async", "group", "hedge", "main", "cache_day"]
+LOCAL = ["csv", "chart", "chart_load", "history", "startup"]
+SCENARIOS = NETWORK + LOCAL
+SIZELESS = {"startup"}
+
+# must never load just by importing the CLI (they belong to the paths that use them)
+HEAVY = ("requests", "urllib3", "dotenv", "sqlite3", "concurrent.futures", "logging.handlers",
+         "aiohttp", "numpy", "matplotlib")
+
+
+# --- measurement helpers ---
+def _pct(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[k] * 1000, 3)
+
+
+def summarize(scenario, size, seconds, samples, errors=0, **extra) -> dict:
+    """One result row; samples are per-op latencies in seconds."""
+    lat = sorted(samples)
+    return {
+        "scenario": scenario,
+        "size": size,
+        "ops": len(lat),
+        "seconds": round(seconds, 4),
+        "throughput": round(len(lat) / seconds, 2) if seconds > 0 else None,
+        "latency_ms": {"p50": _pct(lat, 50), "p95": _pct(lat, 95), "p99": _pct(lat, 99),
+                       "max": _pct(lat, 100)},
+        "errors": errors,
+        **extra,
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KiB elsewhere
+
+
+class _LineClock(io.TextIOBase):
+    """stdout stand-in that timestamps every line written (for main())."""
+
+    def __init__(self):
+        self.stamps = []
+
+    def write(self, s):
+        self.stamps.extend([time.perf_counter()] * s.count("\n"))
+        return len(s)
+
+
+def _cities(size):
+    return [f"Benchtown {i:06d}" for i in range(size)]
+
+
+# --- scenarios (run inside the child) ---
+def run_fetch_raw(wc, size, args, tmp):
+    session = wc._new_session(args.retries, args.backoff)
+    samples, errors = [], 0
+    t0 = time.perf_counter()
+    for city in _cities(size):
+        start = time.perf_counter()
+        payload = wc.fetch_raw(city, UNITS, session, TIMEOUT)
+        samples.append(time.perf_counter() - start)
+        errors += not payload.get("ok")
+    return [summarize("fetch_raw", size, time.perf_counter() - t0, samples, errors)]
+
+
+def run_engine(mode, wc, size, args, tmp, hedged=False):
+    """The same path main() takes: iter_unique over one engine, shared throttle."""
+    from week2 import hedge, metrics, rate_limit
+    from week2.city_index import CityIndex
+
+    workers = 1 if mode == "sequential" else args.max_workers or wc._auto_workers(size, mode)
+    rate_limit.configure(max_concurrency=workers, backoff=args.backoff)
+    hedge.configure("p95" if hedged else None)
+    session = wc._new_session(args.retries, args.backoff)
+    engines = {
+        "sequential": lambda q: wc.iter_sequential(q, UNITS, session, TIMEOUT),
+        "thread": lambda q: wc.iter_parallel(q, UNITS, args.retries, args.backoff, TIMEOUT, None, workers),
+        "async": lambda q: wc.iter_async(q, UNITS, args.retries, args.backoff, TIMEOUT, None, workers),
+        "group": lambda q: wc.iter_grouped(q, UNITS, args.retries, args.backoff, TIMEOUT, None, workers),
+    }
+    cities = _cities(size)
+    index = CityIndex(tmp / "city-index.sqlite3")
+    try:
+        if mode == "group":
+            for _ in wc.iter_unique(engines[mode], cities, index):
+                pass  # warm-up: learn the IDs so the measured pass goes through /group
+
+        pulled = {}
+
+        def feed():
+            for i, city in enumerate(cities):
+                pulled[i] = time.perf_counter()
+                yield city
+
+        samples, errors = [], 0
+        t0 = time.perf_counter()
+        for idx, _, payload in wc.iter_unique(engines[mode], feed(), index):
+            samples.append(time.perf_counter() - pulled[idx])
+            errors += not payload.get("ok")
+        seconds = time.perf_counter() - t0
+    finally:
+        index.close()
+    if not hedged:
+        return [summarize(mode, size, seconds, samples, errors, workers=workers)]
+    hedges = metrics.REGISTRY.summary()["counters"].get("weather_hedges_total", 0)
+    return [summarize("hedge", size, seconds, samples, errors, workers=workers, hedges=hedges)]
+
+
+def _run_main(wc, argv):
+    """weather_cli.main() in-process; returns (seconds, per-line latencies)."""
+    clock = _LineClock()
+    sys.argv = ["weather", *argv]
+    t0 = time.perf_counter()
+    with redirect_stdout(clock):
+        wc.main()
+    seconds = time.perf_counter() - t0
+    stamps = [t0, *clock.stamps]
+    return seconds, [b - a for a, b in zip(stamps, stamps[1:])]
+
+
+def run_main(wc, size, args, tmp):
+    src = tmp / "cities.txt"
+    src.write_text("\n".join(_cities(size)) + "\n", encoding="utf-8")
+    seconds, samples = _run_main(wc, ["--mode", "sequential", "--cities-file", str(src)])
+    return [summarize("main", size, seconds, samples)]
+
+
+def run_cache_day(wc, size, args, tmp):
+    src = tmp / "cities.txt"
+    src.write_text("\n".join(_cities(size)) + "\n", encoding="utf-8")
+    argv = ["--cache-day", "--cities-file", str(src)]
+    if args.max_workers:
+        argv += ["--max-workers", str(args.max_workers)]
+    out = []
+    for name in ("cache_day_cold", "cache_day_warm"):
+        seconds, samples = _run_main(wc, argv)
+        out.append(summarize(name, size, seconds, samples))
+    return out
+
+
+def run_csv(wc, size, args, tmp):
+    from week2.log_store import WeatherLog, log_row
+
+    today = datetime.date.today().isoformat()
+    payload = {"ok": True, "units": UNITS, "temp": 10.5, "humidity": 50, "feels_like": 9.0,
+               "conditions": "clear sky"}
+    rows = [log_row(today, {**payload, "city": c}) for c in _cities(size)]
+    out = []
+    for name in ("csv_append", "csv_dedupe"):
+        samples, written = [], 0
+        t0 = time.perf_counter()
+        with WeatherLog(tmp / "weather_log.csv") as log:  # reopened: 2nd pass catches up from the index
+            for row in rows:
+                start = time.perf_counter()
+                written += log.append(row)
+                samples.append(time.perf_counter() - start)
+        out.append(summarize(name, size, time.perf_counter() - t0, samples, written=written))
+
+    batch = wc.CSV_BATCH
+    samples, written = [], 0
+    t0 = time.perf_counter()
+    with WeatherLog(tmp / "batched_log.csv") as log:
+        for i in range(0, len(rows), batch):
+            start = time.perf_counter()
+            written += sum(log.append_many(rows[i:i + batch]))
+            samples.append(time.perf_counter() - start)
+    out.append(summarize("csv_batch", size, time.perf_counter() - t0, samples, written=written))
+    return out
+
+
+def _write_chart_log(path, rows, cities=CHART_CITIES):
+    start = datetime.datetime(2024, 1, 1)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["date", "city", "temp", "units", "humidity", "feels_like", "conditions"])
+        for i in range(rows):
+            when = start + datetime.timedelta(hours=i // cities)
+            w.writerow([when.isoformat(), f"City {i % cities}", round(10 + 8 * math.sin(i / 500), 1),
+                        UNITS, 50, 9.0, "clear sky"])
+
+
+def run_chart(wc, size, args, tmp):
+    from week2 import chart_weather
+
+    src, png = tmp / "weather_log.csv", tmp / "weather_chart.png"
+    rows = size * CHART_ROWS_PER_SIZE
+    _write_chart_log(src, rows)
+    out = []
+    for name, use_cache in (("chart_full", False), ("chart_cached", True)):
+        with redirect_stdout(io.StringIO()):
+            if use_cache:
+                chart_weather.main(src, png, use_cache=True)  # builds the .npz; not timed
+            samples = []
+            t0 = time.perf_counter()
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                chart_weather.main(src, png, use_cache=use_cache)
+                samples.append(time.perf_counter() - start)
+        out.append(summarize(name, size, time.perf_counter() - t0, samples, rows=rows))
+    return out
+
+
+def run_chart_load(wc, size, args, tmp):
+    """Parse only (no drawing), on a log big enough that per-row work and memory show."""
+    from week2 import chart_weather
+
+    src = tmp / "weather_log.csv"
+    rows = size * LOAD_ROWS_PER_SIZE
+    _write_chart_log(src, rows, LOAD_CITIES)
+    samples = []
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        chart_weather.load_series(src)
+        samples.append(time.perf_counter() - start)
+    return [summarize("chart_load", size, time.perf_counter() - t0, samples, rows=rows)]
+
+
+def _write_history_log(path, rows):
+    """rows readings spread evenly over HISTORY_DAYS; returns them as (city, date, temp, humidity, conditions)."""
+    per_city = max(1, rows // HISTORY_CITIES)
+    step = HISTORY_DAYS * 86_400 // per_city
+    out = []
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["date", "city", "temp", "units", "humidity", "feels_like", "conditions"])
+        for i in range(rows):
+            when = HISTORY_START + datetime.timedelta(seconds=(i // HISTORY_CITIES) * step)
+            r = (f"City {i % HISTORY_CITIES}", when.isoformat(), round(10 + 8 * math.sin(i / 97), 1),
+                 i * 7 % 101, HISTORY_CONDITIONS[i % len(HISTORY_CONDITIONS)])
+            w.writerow([r[1], r[0], r[2], UNITS, r[3], 9.0, r[4]])
+            out.append(r)
+    return out
+
+
+def _history_expected(readings, city, start, end):
+    """summary() the slow way: every reading of city with start <= its day <= end."""
+    from collections import Counter
+    from week2.history import humidity_band
+
+    hit = [r for r in readings if r[0] == city and (not start or r[1][:10] >= start) and (not end or r[1][:10] <= end)]
+    if not hit:
+        return None
+    temps = [r[2] for r in hit]
+    return {"readings": len(hit), "min": min(temps), "mean": sum(temps) / len(temps), "max": max(temps),
+            "humidity_mean": sum(r[3] for r in hit) / len(hit),
+            "humidity": dict(Counter(humidity_band(r[3]) for r in hit)),
+            "conditions": dict(Counter(r[4] for r in hit if r[4]))}
+
+
+def _history_diff(got, want):
+    if got is None or want is None:
+        return None if got is want else f"got {got and got['readings']} readings, want {want and want['readings']}"
+    for k, v in want.items():
+        g = got[k]
+        same = math.isclose(g, v, rel_tol=1e-9) if isinstance(v, float) else (dict(g) if k in ("humidity", "conditions") else g) == v
+        if not same:
+            return f"{k}: got {g!r}, want {v!r}"
+    return None
+
+
+def run_history(wc, size, args, tmp):
+    """Range queries on the history index, each checked against a brute-force scan of the rows."""
+    from week2.history import HistoryIndex
+
+    src = tmp / "weather_log.csv"
+    rows = size * CHART_ROWS_PER_SIZE
+    readings = _write_history_log(src, rows)
+    samples, wrong = [], []
+    with HistoryIndex([src], tmp / "history.sqlite3") as index:
+        start = time.perf_counter()
+        index.sync()
+        sync_seconds = time.perf_counter() - start
+        for _ in range(args.repeat):
+            for lo, hi in HISTORY_RANGES:
+                for i in range(HISTORY_CITIES):
+                    city = f"City {i}"
+                    start = time.perf_counter()
+                    got = index.summary(city, lo, hi)
+                    samples.append(time.perf_counter() - start)
+                    diff = _history_diff(got, _history_expected(readings, city, lo, hi))
+                    if diff:
+                        wrong.append(f"summary({city!r}, {lo}, {hi}) {diff}")
+    return [summarize("history", size, sum(samples), samples, rows=rows,  # not the brute-force scans
+                      sync_seconds=round(sync_seconds, 4), violations=sorted(set(wrong)))]
+
+
+def _timed_runs(cmd, runs, env):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=REPO, env=env, capture_output=True, check=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_startup(wc, size, args, tmp):
+    env = {k: v for k, v in os.environ.items() if k != "OPENWEATHER_API_KEY"}  # must not be needed
+    runs = max(5, args.repeat)
+    py = sys.executable
+
+    proc = subprocess.run([py, "-c", "import json, sys, week2.weather_cli; print(json.dumps(sorted(sys.modules)))"],
+                          cwd=REPO, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:  # e.g. exits at import without an API key
+        tail = (proc.stderr or proc.stdout).strip().splitlines()[-1:]
+        return [summarize("startup_import", size, 0, [], violations=[f"import failed: {' '.join(tail)}"])]
+    heavy = sorted(set(HEAVY) & set(json.loads(proc.stdout)))
+
+    samples = []
+    for _ in range(runs):
+        proc = subprocess.run([py, "-X", "importtime", "-c", "import week2.weather_cli"], cwd=REPO, env=env,
+                              capture_output=True, text=True, check=True)
+        cumulative_us = next(int(line.split("|")[1]) for line in proc.stderr.splitlines()
+                             if line.split("|")[-1].strip() == "week2.weather_cli")
+        samples.append(cumulative_us / 1e6)
+    out = [summarize("startup_import", size, sum(samples), samples,
+                     violations=[f"importing the CLI loads {m}" for m in heavy])]
+
+    for flag in ("--version", "--help"):
+        samples = _timed_runs([py, "-m", "week2.weather_cli", flag], runs, env)
+        out.append(summarize(f"startup_{flag[2:]}", size, sum(samples), samples))
+    samples = _timed_runs([py, "-c", "pass"], runs, env)
+    out.append(summarize("startup_python", size, sum(samples), samples))
+    return out
+
+
+RUNNERS = {
+    "fetch_raw": run_fetch_raw,
+    "sequential": lambda wc, *a: run_engine("sequential", wc, *a),
+    "thread": lambda wc, *a: run_engine("thread", wc, *a),
+    "async": lambda wc, *a: run_engine("async", wc, *a),
+    "group": lambda wc, *a: run_engine("group", wc, *a),
+    "hedge": lambda wc, *a: run_engine("thread", wc, *a, hedged=True),
+    "main": run_main,
+    "cache_day": run_cache_day,
+    "csv": run_csv,
+    "chart": run_chart,
+    "chart_load": run_chart_load,
+    "history": run_history,
+    "startup": run_startup,
+}
+
+
+def child(args):
+    """Runs one (scenario, size) and prints its result rows as JSON."""
+    with tempfile.TemporaryDirectory(prefix="weather-bench-") as tmp:
+        tmp = Path(tmp)
+        os.environ.update({
+            "OPENWEATHER_API_KEY": "bench",
+            "OPENWEATHER_URL": args.url,
+            "CACHE_PATH": str(tmp / "weather-cache.sqlite3"),
+            "CITY_INDEX_PATH": str(tmp / "city-index.sqlite3"),
+            # never hand the cities to a running `weather serve`: measure the in-process engines
+            "WEATHER_DAEMON": "off",
+            "WEATHER_DAEMON_FILE": str(tmp / "daemon.json"),
+            "LOG_DIR": str(tmp / "logs"),  # main() runs repeatedly here: keep the run log out of the repo
+            "UNITS": UNITS,
+            "MPLBACKEND": "Agg",
+        })
+        sys.path.insert(0, str(REPO))
+        from week2 import weather_cli as wc
+
+        results = RUNNERS[args.child](wc, args.size, args, tmp)
+    rss = peak_rss_mb()
+    for r in results:
+        r["peak_rss_mb"] = rss
+    print(json.dumps(results))
+
+
+# --- parent ---
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Regressions vs an earlier run: throughput down or p95 up by more than `tolerance`."""
+    old = {(r["scenario"], r["size"]): r for r in baseline["results"]}
+    found = []
+    for r in results:
+        b = old.get((r["scenario"], r["size"]))
+        if not b:
+            continue
+        if b["throughput"] and r["throughput"] and r["throughput"] < b["throughput"] * (1 - tolerance):
+            found.append(f"{r['scenario']}@{r['size']}: throughput {b['throughput']} -> {r['throughput']}/s")
+        p95, old_p95 = r["latency_ms"]["p95"], b["latency_ms"]["p95"]
+        if p95 and old_p95 and p95 > old_p95 * (1 + tolerance):
+            found.append(f"{r['scenario']}@{r['size']}: p95 {old_p95} -> {p95} ms")
+    return found
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Offline benchmarks for weather-cli.")
+    p.add_argument("--scenarios", default=",".join(SCENARIOS),
+                   help=f"Comma-separated subset of: {', '.join(SCENARIOS)}.")
+    p.add_argument("--sizes", default="10,100,1000", help="Cities (or chart rows/100) per run.")
+    p.add_argument("--max-workers", type=int, default=0, help="Concurrency for the parallel modes (0=auto).")
+    p.add_argument("--retries", type=int, default=3)
+    p.add_argument("--backoff", type=float, default=0.1)
+    p.add_argument("--repeat", type=int, default=3, help="Chart renders per measurement.")
+    p.add_argument("--out", help="Write the JSON here instead of stdout.")
+    p.add_argument("--baseline", help="Earlier --out file; exit 1 if anything regressed.")
+    p.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs --baseline (default 0.2).")
+    p.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    p.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    p.add_argument("--url", help=argparse.SUPPRESS)
+    try:
+        from .mock_server import add_args
+    except ImportError:
+        from mock_server import add_args
+    add_args(p)
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        return child(args)
+    try:
+        from .mock_server import from_args
+    except ImportError:
+        from mock_server import from_args
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+    sizes = [int(s) for s in args.sizes.split(",")]
+    passthrough = ["--max-workers", str(args.max_workers), "--retries", str(args.retries),
+                   "--backoff", str(args.backoff), "--repeat", str(args.repeat)]
+
+    results = []
+    with from_args(args) as server:
+        for scenario in scenarios:
+            for size in [0] if scenario in SIZELESS else sizes:
+                print(f"{scenario} @ {size} ...", file=sys.stderr, flush=True)
+                before = server.snapshot()
+                proc = subprocess.run([sys.executable, __file__, "--child", scenario, "--size", str(size),
+                                       "--url", server.url, *passthrough],
+                                      cwd=REPO, capture_output=True, text=True)
+                if proc.returncode != 0:
+                    raise SystemExit(f"{scenario} @ {size} failed:\n{proc.stderr}")
+                after = server.snapshot()
+                rows = json.loads(proc.stdout.strip().splitlines()[-1])
+                for r in rows:
+                    if scenario in NETWORK:
+                        r["server"] = {k: after[k] - before[k] for k in after}
+                results.extend(rows)
+
+    report = {
+        "meta": {
+            "when": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mock": {"latency_ms": args.latency, "jitter_ms": args.jitter, "error_rate": args.error_rate,
+                     "rate_429": args.rate_429, "retry_after": args.retry_after},
+            "max_workers": args.max_workers,
+            "retries": args.retries,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    regressions = [f"{r['scenario']}: {v}" for r in results for v in r.get("violations", ())]
+    if args.baseline:
+        regressions += compare(results, json.loads(Path(args.baseline).read_text(encoding="utf-8")),
+                               args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# week2/async_fetch.py
+"""
+asyncio fetch engine: one aiohttp session (one keep-alive connection pool)
+shared by every request, with a semaphore bounding in-flight sockets.
+Why: thousands of cities without thousands of threads.
+
+Transport only -- callers build URLs and turn (status, body) into payloads,
+same split as http_utils.make_session vs weather_cli.fetch_raw. With a
+rate_limit.Throttle, every attempt also waits for the shared bucket/limit.
+DNS/connect/TTFB timings come from aiohttp trace hooks into the same metrics
+the requests-based engines fill.
+"""
+import asyncio, threading, time
+
+try:
+    from .pipeline import pump
+    from .rate_limit import retry_after_seconds as _retry_after
+    from . import metrics
+except ImportError:
+    from pipeline import pump
+    from rate_limit import retry_after_seconds as _retry_after
+    import metrics
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)  # same list make_session retries on
+
+
+async def _enter(throttle) -> float:
+    """Wait for the shared token bucket and a concurrency slot without blocking the loop."""
+    start = time.perf_counter()
+    await asyncio.sleep(throttle.reserve())
+    while (sent := throttle.try_enter()) is None:
+        await asyncio.sleep(0.01)
+    metrics.observe("weather_throttle_wait_seconds", time.perf_counter() - start)
+    return sent
+
+
+async def _get(session, sem, url, timeout, retries, backoff, throttle=None, headers=None):
+    """
+    GET with retry/backoff like urllib3's Retry.
+    Returns (status, body, error, (etag, last_modified)).
+    """
+    import aiohttp
+
+    attempt, started = 0, None
+    try:
+        while True:
+            wait, status = None, None
+            if throttle is not None:
+                sent = await _enter(throttle)
+            try:
+                queued = time.perf_counter()
+                async with sem:  # hold a slot only while a socket is in use, not while sleeping
+                    if started is None:
+                        started = time.perf_counter()
+                        metrics.observe("weather_queue_wait_seconds", started - queued)
+                    try:
+                        async with session.get(url, headers=headers,
+                                               timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+                            body = await r.read()
+                            status = r.status
+                            metrics.inc("weather_http_responses_total", status=r.status)
+                            if r.status not in RETRY_STATUSES or attempt >= retries:
+                                seen = (r.headers.get("ETag"), r.headers.get("Last-Modified"))
+                                return r.status, body, None, seen
+                            wait = _retry_after(r.headers)
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        metrics.inc("weather_http_errors_total", kind=e.__class__.__name__)
+                        if attempt >= retries:
+                            return None, None, str(e) or e.__class__.__name__, (None, None)
+            finally:
+                if throttle is not None:
+                    throttle.exit(sent, status, wait)
+            attempt += 1
+            metrics.inc("weather_http_retries_total")
+            if throttle is not None:
+                wait = throttle.backoff(attempt - 1, wait)  # jittered, so workers don't re-align
+            elif wait is None:
+                wait = backoff * (2 ** (attempt - 1))  # 0.5s, 1.0s, 2.0s ...
+            await asyncio.sleep(wait)
+    finally:
+        if started is not None:
+            metrics.observe("weather_fetch_seconds", time.perf_counter() - started)
+
+
+def _span(start_signal, end_signal, metric):
+    """Trace hooks timing start -> end of one aiohttp phase into `metric`."""
+    attr = f"_{metric}_start"
+
+    async def on_start(session, ctx, params):
+        setattr(ctx, attr, time.perf_counter())
+
+    async def on_end(session, ctx, params):
+        start = getattr(ctx, attr, None)
+        if start is not None:
+            metrics.observe(metric, time.perf_counter() - start)
+
+    start_signal.append(on_start)
+    end_signal.append(on_end)
+
+
+def _trace_config():
+    import aiohttp
+
+    tc = aiohttp.TraceConfig()
+    _span(tc.on_dns_resolvehost_start, tc.on_dns_resolvehost_end, "weather_http_dns_seconds")
+    _span(tc.on_connection_create_start, tc.on_connection_create_end, "weather_http_connect_seconds")
+    _span(tc.on_request_start, tc.on_request_end, "weather_http_ttfb_seconds")  # ends at response headers
+
+    async def new_connection(session, ctx, params):
+        metrics.inc("weather_http_connections_total")
+
+    tc.on_connection_create_end.append(new_connection)
+    return tc
+
+
+async def _open(max_workers, user_agent):
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=max_workers, keepalive_timeout=30)
+    session = aiohttp.ClientSession(connector=connector, headers={"User-Agent": user_agent},
+                                    trace_configs=[_trace_config()])
+    return session, asyncio.Semaphore(max_workers)
+
+
+class AsyncClient:
+    """
+    A private event loop on a helper thread holding one aiohttp session.
+    submit(url) returns a concurrent.futures.Future of _get()'s tuple, so
+    synchronous callers can keep a bounded number in flight (pipeline.pump).
+    """
+
+    def __init__(self, max_workers: int = 64, timeout: float = 10, retries: int = 3,
+                 backoff: float = 0.5, user_agent: str = "weather-cli/0.1", throttle=None):
+        try:
+            import aiohttp  # noqa: F401
+        except ImportError:
+            raise SystemExit("async mode needs aiohttp: pip install 'james-weather-cli[async]'")
+        self.timeout, self.retries, self.backoff = timeout, retries, backoff
+        self.throttle = throttle
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="weather-async", daemon=True)
+        self._thread.start()
+        self._session, self._sem = self._call(_open(max(1, max_workers), user_agent)).result()
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def submit(self, url, headers=None):
+        return self._call(_get(self._session, self._sem, url, self.timeout, self.retries, self.backoff,
+                               self.throttle, headers))
+
+    def close(self):
+        try:
+            self._call(self._session.close()).result()
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_many(urls, max_workers: int = 64, window: int = 0, **kwargs):
+    """
+    Fetch URLs concurrently; yields (i, status, body_bytes, error_str) as each
+    one completes (i = position in `urls`). `urls` may be any iterable; it is
+    read lazily, never more than `window` (default 2x max_workers) ahead.
+    error_str is set (and status/body are None) only when the request never
+    got an HTTP response.
+    """
+    with AsyncClient(max_workers, **kwargs) as client:
+        for (i, _), (status, body, err, _) in pump(enumerate(urls), lambda item: client.submit(item[1]),
+                                                window or 2 * max_workers):
+            yield i, status, body, err
+
+
+def fetch_many(urls, **kwargs):
+    """iter_many collected into [(status, body, error)] in input order."""
+    urls = list(urls)
+    out = [None] * len(urls)
+    for i, status, body, err in iter_many(urls, **kwargs):
+        out[i] = (status, body, err)
+    return out
@@ -0,0 +1,200 @@
+# week2/cache_store.py
+"""
+On-disk response cache: SQLite with per-entry TTL + LRU size limit.
+Why: the old data/cache/YYYY-MM-DD_units.json was rewritten whole on every run,
+never evicted, and overlapping cron runs clobbered each other's file.
+
+- WAL mode + busy_timeout -> several `weather` processes can read/write at once
+- every write is its own short transaction -> no lost updates, no torn files
+- one lock around the connection -> safe to share across fetch_parallel threads
+
+Freshness: an entry is fresh for `ttl`, then stale for `stale` more seconds
+(served at once while the caller refreshes it in the background), then
+expired. Expired entries are kept a while (KEEP_EXPIRED) with the upstream's
+ETag / Last-Modified, so the next fetch can be a conditional request; a 304
+then only moves the entry's expiry -- the payload is not rewritten.
+"""
+from collections import OrderedDict
+from pathlib import Path
+import json, os, sqlite3, threading, time
+
+try:
+    from . import sidecar
+    from .city_index import name_key
+except ImportError:
+    import sidecar
+    from city_index import name_key
+
+DEFAULT_PATH = Path(__file__).parents[1] / "data" / "cache" / "weather-cache.sqlite3"
+DEFAULT_TTL = 600          # seconds; current conditions go stale fast
+DEFAULT_STALE = 0          # seconds past ttl an entry is still served (while refreshed)
+DEFAULT_MAX_ENTRIES = 20_000
+KEEP_EXPIRED = 86_400      # seconds an expired entry is kept for revalidation
+PRIOR_MAX = 10_000         # expired entries remembered between lookup and fetch
+_CHUNK = 500               # stay well under SQLite's bound-parameter limit
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key        TEXT PRIMARY KEY,
+    payload    TEXT NOT NULL,
+    stored_at  REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    used_at    REAL NOT NULL,
+    etag          TEXT,
+    last_modified TEXT
+);
+CREATE INDEX IF NOT EXISTS responses_used ON responses(used_at);
+CREATE INDEX IF NOT EXISTS responses_expires ON responses(expires_at);
+"""
+
+
+def cache_key(city, units: str) -> str:
+    """City IDs (ints) and names live in separate key spaces: 'metric:#5128581', 'metric:new york'."""
+    if isinstance(city, int):
+        return f"{units}:#{city}"
+    return f"{units}:{name_key(city)}"
+
+
+class ResponseCache:
+    def __init__(self, path=None, ttl: float | None = None, max_entries: int | None = None,
+                 stale: float | None = None):
+        self.path = Path(path or os.getenv("CACHE_PATH") or DEFAULT_PATH)
+        self.ttl = float(ttl if ttl is not None else os.getenv("CACHE_TTL", DEFAULT_TTL))
+        self.stale = float(stale if stale is not None else os.getenv("CACHE_STALE", DEFAULT_STALE))
+        self.max_entries = int(max_entries if max_entries is not None
+                               else os.getenv("CACHE_MAX", DEFAULT_MAX_ENTRIES))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._prior = OrderedDict()  # key -> (payload json, etag, last_modified) of expired entries
+        # autocommit mode; writes open their own sidecar.immediate() transaction
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=30000")
+        self._db.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Caches from before conditional requests lack the validator columns."""
+        cols = {row[1] for row in self._db.execute("PRAGMA table_info(responses)")}
+        for col in ("etag", "last_modified"):
+            if col not in cols:
+                try:
+                    self._db.execute(f"ALTER TABLE responses ADD COLUMN {col} TEXT")
+                except sqlite3.OperationalError:
+                    pass  # another process added it first
+
+    # --- reads ---
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys) -> dict:
+        """Fresh entries only; touches used_at so they count as recently used."""
+        return {k: p for k, (p, state) in self.lookup_many(keys).items() if state == "fresh"}
+
+    def lookup_many(self, keys) -> dict:
+        """
+        {key: (payload, "fresh" | "stale")} for servable entries; touches used_at.
+        Expired entries with validators are set aside for conditional_headers().
+        """
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _CHUNK):
+                chunk = keys[i:i + _CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT key, payload, expires_at, etag, last_modified FROM responses "
+                    f"WHERE key IN ({marks})", chunk,
+                ).fetchall()
+                for k, payload, expires, etag, modified in rows:
+                    if expires > now:
+                        found[k] = (json.loads(payload), "fresh")
+                    elif expires + self.stale > now:
+                        found[k] = (json.loads(payload), "stale")
+                    if expires <= now and (etag or modified):
+                        self._prior[k] = (payload, etag, modified)  # parsed only on a 304
+                        self._prior.move_to_end(k)
+            while len(self._prior) > PRIOR_MAX:
+                self._prior.popitem(last=False)
+            if found:
+                self._write("UPDATE responses SET used_at = ? WHERE key = ?",
+                            [(now, k) for k in found])
+        return found
+
+    def conditional_headers(self, key: str) -> dict:
+        """If-None-Match / If-Modified-Since for an expired entry seen by lookup_many, else {}."""
+        with self._lock:
+            prior = self._prior.get(key)
+        if prior is None:
+            return {}
+        _, etag, modified = prior
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+        return headers
+
+    def not_modified(self, key: str, ttl: float | None = None):
+        """After a 304: the stored payload, fresh again for ttl (expiry moved, payload not rewritten)."""
+        with self._lock:
+            prior = self._prior.pop(key, None)
+            if prior is None:
+                return None
+            now = time.time()
+            self._write("UPDATE responses SET stored_at = ?, expires_at = ?, used_at = ? WHERE key = ?",
+                        [(now, now + (self.ttl if ttl is None else ttl), now, key)])
+        return json.loads(prior[0])
+
+    # --- writes ---
+    def set(self, key: str, payload: dict, ttl: float | None = None):
+        self.set_many([(key, payload)], ttl)
+
+    def set_many(self, items, ttl: float | None = None):
+        """items: (key, payload) or (key, payload, (etag, last_modified))."""
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        rows = []
+        for k, p, *v in items:
+            etag, modified = v[0] if v else (None, None)
+            # default=dict: a Payload (or any mapping) is stored as its dict form
+            rows.append((k, json.dumps(p, ensure_ascii=False, separators=(",", ":"), default=dict),
+                         now, expires, now, etag, modified))
+        if rows:
+            with self._lock:
+                for k, *_ in rows:
+                    self._prior.pop(k, None)
+                self._write("INSERT OR REPLACE INTO responses (key, payload, stored_at, expires_at, used_at, "
+                            "etag, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def prune(self):
+        """Drop long-expired rows, then least-recently-used rows beyond max_entries."""
+        with self._lock, sidecar.immediate(self._db):
+            self._db.execute("DELETE FROM responses WHERE expires_at <= ?",
+                             (time.time() - max(self.stale, KEEP_EXPIRED),))
+            (count,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            extra = count - self.max_entries
+            if extra > 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY used_at LIMIT ?)", (extra,))
+
+    def close(self):
+        try:
+            self.prune()
+        finally:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write(self, sql, rows):
+        # caller holds self._lock
+        with sidecar.immediate(self._db):
+            self._db.executemany(sql, rows)
@@ -0,0 +1,111 @@
+# week2/chart_cache.py
+"""
+Incremental chart data: per-city series kept in a binary .npz next to the log.
+Why: weather-daily appends a handful of rows, then used to re-parse the whole
+multi-year CSV just to redraw the chart.
+
+The cache remembers how many CSV bytes it has folded in, plus checksums of the
+header and of the last bytes it read. If those still match, only the rows
+after that offset are parsed; otherwise (log rewritten/truncated) it rebuilds.
+When the same process just wrote those rows (WeatherLog.last_append) and they
+start exactly at the cached offset, they are folded in from memory instead.
+"""
+from pathlib import Path
+import csv, hashlib, json, os
+import numpy as np
+
+try:
+    from .chart_weather import read_columns, columns_from_rows, group_by_city
+except ImportError:
+    from chart_weather import read_columns, columns_from_rows, group_by_city
+
+CACHE_VERSION = 2  # 2: temps held in CANONICAL_UNITS (°C), not as logged
+_TAIL = 4096  # bytes before the offset that must be unchanged
+
+
+def cache_path_for(csv_path) -> Path:
+    """data/weather_log.csv -> data/weather_log.chart.npz"""
+    return Path(csv_path).with_suffix(".chart.npz")
+
+
+def _fingerprint(path: Path, offset: int) -> dict:
+    with path.open("rb") as f:
+        head = hashlib.sha1(f.readline()).hexdigest()
+        f.seek(max(0, offset - _TAIL))
+        tail = hashlib.sha1(f.read(min(offset, _TAIL))).hexdigest()
+    return {"head": head, "tail": tail}
+
+
+def _read(cache: Path):
+    """(meta, series, units_seen) from the cache file, or None if missing/unreadable."""
+    try:
+        with np.load(cache, allow_pickle=False) as z:
+            meta = json.loads(str(z["meta"]))
+            if meta.get("version") != CACHE_VERSION:
+                return None
+            bounds = z["offsets"][1:-1]
+            dates = np.split(z["dates"].astype("datetime64[s]"), bounds)
+            temps = np.split(z["temps"], bounds)
+            series = {str(c): (d, t) for c, d, t in zip(z["cities"], dates, temps)}
+    except (OSError, KeyError, ValueError):
+        return None
+    return meta, series, set(meta.get("units", []))
+
+
+def _write(cache: Path, meta: dict, series: dict, units_seen: set):
+    """Flat arrays + offsets (one blob per field, not per city); atomic replace."""
+    cities = sorted(series)
+    lengths = [len(series[c][0]) for c in cities]
+    tmp = cache.with_name(cache.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez(
+            f,
+            meta=np.array(json.dumps({**meta, "version": CACHE_VERSION, "units": sorted(units_seen)})),
+            cities=np.array(cities, dtype=str),
+            offsets=np.r_[0, np.cumsum(lengths, dtype=np.int64)],
+            dates=np.concatenate([series[c][0] for c in cities] or [np.array([], "datetime64[s]")]).astype(np.int64),
+            temps=np.concatenate([series[c][1] for c in cities] or [np.array([], np.float32)]).astype(np.float32),
+        )
+    os.replace(tmp, cache)
+
+
+def load_series_cached(csv_path, cache=None, appended=None):
+    """
+    Same result as chart_weather.load_series, but only parses rows appended
+    since the last call. Returns ({city: (dates, temps)}, units_seen).
+    `appended` = (start, end, rows) of a write this process just made.
+    """
+    csv_path = Path(csv_path)
+    cache = Path(cache) if cache else cache_path_for(csv_path)
+
+    start, series, units_seen = 0, {}, set()
+    cached = _read(cache) if cache.exists() else None
+    if cached:
+        meta, old_series, old_units = cached
+        offset = meta.get("offset", 0)
+        if (csv_path.stat().st_size >= offset
+                and _fingerprint(csv_path, offset) == {"head": meta.get("head"), "tail": meta.get("tail")}):
+            start, series, units_seen = offset, old_series, old_units
+
+    if appended and start and start == appended[0] and csv_path.stat().st_size == appended[1]:
+        with csv_path.open("rb") as f:
+            cols = next(csv.reader([f.readline().decode("utf-8-sig")]), [])
+        (names, codes, dates, temps, units), end = columns_from_rows(appended[2], cols), appended[1]
+    else:
+        (names, codes, dates, temps, units), end = read_columns(csv_path, start)
+    if end == start and cached and start:
+        return series, units_seen  # nothing new: no parse, no rewrite
+
+    # fold the new rows into the touched cities only
+    for city, (d, t) in group_by_city(names, codes, dates, temps).items():
+        if city in series:
+            od, ot = series[city]
+            d, t = np.concatenate([od, d]), np.concatenate([ot, t])
+            if len(od) and d[len(od)] < od[-1]:  # late/backfilled rows: re-sort this city
+                order = np.argsort(d, kind="stable")
+                d, t = d[order], t[order]
+        series[city] = (d, t)
+    units_seen |= units
+
+    _write(cache, {"offset": end, **_fingerprint(csv_path, end)}, series, units_seen)
+    return series, units_seen
@@ -0,0 +1,211 @@
+# week2/chart_multi.py
+"""
+Many small charts: one PNG per city, or per city per month, drawn across a
+process pool.
+Why: the combined chart is unreadable past a few dozen cities, and the
+nightly report needs ~3,000 small charts that one core drew one by one.
+
+- Data: the series are loaded once (through the chart cache, so usually only
+  new log rows are parsed) and packed into two shared-memory blocks (dates,
+  temps). Workers map them and slice their charts' rows; nothing is re-parsed,
+  and a job is just (title, start, stop, file).
+- Workers draw on bare Figures with the Agg backend (no pyplot state, no GUI).
+- Unchanged charts are skipped: each chart's content hash (its rows, units,
+  size, RENDER_VERSION) is kept in <out-dir>/charts.json, and a chart whose
+  hash matches and whose file still exists is not redrawn.
+
+    python week2/chart_multi.py                              # data/charts/<city>.png
+    python week2/chart_multi.py --split month --max-workers 8
+"""
+from pathlib import Path
+import argparse, hashlib, json, os, re, zlib
+import numpy as np
+
+try:
+    from .chart_weather import csv_path, chart_units, draw, load_series
+except ImportError:
+    from chart_weather import csv_path, chart_units, draw, load_series
+
+OUT_DIR = Path(__file__).parents[1] / "data" / "charts"
+FIGSIZE = (4, 2.5)
+DPI = 100
+MARGINS = {"left": 0.17, "right": 0.96, "bottom": 0.2, "top": 0.88}
+RENDER_VERSION = 1  # bump when the drawing changes, so every chart is redrawn once
+MANIFEST = "charts.json"
+
+
+def _pack(series):
+    """Sorted names + flat arrays (the chart cache's layout): (names, offsets, dates int64, temps float32)."""
+    names = sorted(series)
+    lengths = [len(series[c][0]) for c in names]
+    offsets = np.r_[0, np.cumsum(lengths, dtype=np.int64)]
+    dates = np.concatenate([series[c][0] for c in names] or [np.array([], "datetime64[s]")])
+    temps = np.concatenate([series[c][1] for c in names] or [np.array([], np.float32)])
+    return names, offsets, dates.astype("datetime64[s]").astype(np.int64), temps.astype(np.float32)
+
+
+def _file_name(name: str, taken: set) -> str:
+    """A file-system-safe, unique stem for a city name."""
+    stem = re.sub(r"[^\w.-]+", "_", name).strip("._") or "city"
+    if stem.lower() in taken:  # "New York" vs "New_York", or case-only differences on Windows
+        stem = f"{stem}-{zlib.crc32(name.encode('utf-8')):08x}"
+    taken.add(stem.lower())
+    return stem
+
+
+def plan(names, offsets, dates, split="city"):
+    """(file, title, start, stop) per chart; rows [start, stop) of the packed arrays."""
+    taken = set()
+    for i, name in enumerate(names):
+        lo, hi = int(offsets[i]), int(offsets[i + 1])
+        stem = _file_name(name, taken)
+        if split == "city":
+            yield f"{stem}.png", name, lo, hi
+            continue
+        months = dates[lo:hi].astype("datetime64[s]").astype("datetime64[M]")  # each city is date-sorted
+        cuts = np.flatnonzero(months[1:] != months[:-1]) + 1
+        for a, b in zip(np.r_[0, cuts], np.r_[cuts, hi - lo]):
+            month = str(months[a])
+            yield f"{month}/{stem}.png", f"{name} {month}", lo + int(a), lo + int(b)
+
+
+def _digest(title, dates, temps, units) -> str:
+    h = hashlib.sha1(json.dumps([RENDER_VERSION, title, units, FIGSIZE, DPI]).encode())
+    h.update(dates)
+    h.update(temps)
+    return h.hexdigest()
+
+
+def draw_one(out, title, dates, temps, units):
+    """One small chart (dates int64 seconds, temps °C) -> out."""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=FIGSIZE)
+    fig.subplots_adjust(**MARGINS)  # fixed size, so no tight_layout pass (a quarter of the time per chart)
+    draw(fig.add_subplot(), {title: (dates.view("datetime64[s]"), temps)}, units,
+         int(FIGSIZE[0] * DPI), title=title, legend=False, compact=True)
+    fig.savefig(out, dpi=DPI)
+
+
+# ---------- workers ----------
+_shared = None  # in a worker: (blocks, dates, temps, units, out_dir)
+
+
+def _attach(block_names, n, units, out_dir):
+    """Pool initializer: Agg, then map the parent's arrays (no copy, no re-parse)."""
+    global _shared
+    import matplotlib
+    from multiprocessing import shared_memory
+
+    matplotlib.use("Agg")
+    blocks = [shared_memory.SharedMemory(name=b) for b in block_names]
+    dates = np.ndarray((n,), dtype=np.int64, buffer=blocks[0].buf)
+    temps = np.ndarray((n,), dtype=np.float32, buffer=blocks[1].buf)
+    _shared = (blocks, dates, temps, units, Path(out_dir))
+
+
+def _render(job):
+    rel, title, lo, hi = job
+    _, dates, temps, units, out_dir = _shared
+    draw_one(out_dir / rel, title, dates[lo:hi], temps[lo:hi], units)
+    return rel
+
+
+def _share(arr):
+    """arr copied once into a new shared-memory block: (block, view)."""
+    from multiprocessing import shared_memory
+
+    block = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+    view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=block.buf)
+    view[:] = arr
+    return block, view
+
+
+# ---------- driver ----------
+
+def render_many(series, units_seen, out_dir=OUT_DIR, split="city", units=None,
+                max_workers: int = 0, force: bool = False) -> dict:
+    """
+    series: {city: (dates, temps °C)} as load_series returns. Draws every
+    changed chart under out_dir; returns counts: rendered, unchanged.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    out_dir = Path(out_dir)
+    units = chart_units(units_seen, units)
+    names, offsets, dates, temps = _pack(series)
+
+    manifest_path = out_dir / MANIFEST
+    try:
+        old = json.loads(manifest_path.read_text(encoding="utf-8")) if not force else {}
+    except (OSError, ValueError):
+        old = {}
+    done, todo = {}, []
+    for rel, title, lo, hi in plan(names, offsets, dates, split):
+        digest = _digest(title, dates[lo:hi], temps[lo:hi], units)
+        if old.get(rel) == digest and (out_dir / rel).exists():
+            done[rel] = digest
+        else:
+            todo.append((rel, title, lo, hi, digest))
+    stats = {"rendered": 0, "unchanged": len(done)}
+    for d in {(out_dir / rel).parent for rel, *_ in todo}:
+        d.mkdir(parents=True, exist_ok=True)
+
+    digests = {rel: digest for rel, *_, digest in todo}
+    jobs = [job[:4] for job in todo]
+    workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    blocks = []
+    try:
+        if workers <= 1:  # not worth a pool (or one core): draw here
+            for rel, title, lo, hi in jobs:
+                draw_one(out_dir / rel, title, dates[lo:hi], temps[lo:hi], units)
+                done[rel] = digests[rel]
+                stats["rendered"] += 1
+        else:
+            blocks = [_share(dates), _share(temps)]
+            with ProcessPoolExecutor(workers, initializer=_attach,
+                                     initargs=([b.name for b, _ in blocks], len(dates), units, str(out_dir))) as ex:
+                for rel in ex.map(_render, jobs, chunksize=max(1, len(jobs) // (workers * 8))):
+                    done[rel] = digests[rel]
+                    stats["rendered"] += 1
+    finally:
+        for block, _ in blocks:
+            block.close()
+            block.unlink()
+        # only charts that exist now are recorded; a failed run redraws the rest next time
+        tmp = manifest_path.with_name(MANIFEST + ".tmp")
+        out_dir.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps(done, sort_keys=True) + "\n", encoding="utf-8")
+        os.replace(tmp, manifest_path)
+    return stats
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="One small chart per city (or per city per month), in parallel.")
+    p.add_argument("--log", default=csv_path, help="Log to chart (default data/weather_log.csv).")
+    p.add_argument("--out-dir", default=OUT_DIR, help="Where the PNGs go (default data/charts).")
+    p.add_argument("--split", choices=["city", "month"], default="city",
+                   help="city: <city>.png over the whole log; month: <YYYY-MM>/<city>.png.")
+    p.add_argument("--units", choices=["metric", "imperial", "standard"],
+                   help="Axis units (default: the log's only unit, else UNITS env, else metric).")
+    p.add_argument("--max-workers", type=int, default=0, help="Render processes (0 = one per CPU).")
+    p.add_argument("--force", action="store_true", help="Redraw every chart, changed or not.")
+    p.add_argument("--no-cache", action="store_true", help="Parse the whole log instead of the chart cache.")
+    args = p.parse_args(argv)
+
+    if not Path(args.log).exists():
+        raise SystemExit(f"Missing {args.log}. Run log_weather_daily.py first.")
+    if args.no_cache:
+        series, units_seen = load_series(args.log)
+    else:
+        try:
+            from .chart_cache import load_series_cached
+        except ImportError:
+            from chart_cache import load_series_cached
+        series, units_seen = load_series_cached(args.log)
+    stats = render_many(series, units_seen, args.out_dir, args.split, args.units, args.max_workers, args.force)
+    print(f"Charts → {args.out_dir}: {stats['rendered']} drawn, {stats['unchanged']} unchanged")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,99 +1,327 @@
 from pathlib import Path
-import csv
-from datetime import datetime, timedelta
+from itertools import islice
+from operator import itemgetter
+import csv, io, os
+import warnings
+import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
+try:
+    from .payload import CANONICAL_UNITS, TO_KELVIN
+except ImportError:
+    from payload import CANONICAL_UNITS, TO_KELVIN
+
 # paths
 repo_root = Path(__file__).parents[1]
 csv_path = repo_root / "data" / "weather_log.csv"
 out_path = repo_root / "data" / "weather_chart.png"
 
-if not csv_path.exists():
-    raise SystemExit(f"Missing {csv_path}. Run log_weather_daily.py first.")
-
-# unit labels + the set of units we see in the CSV
+# unit labels
 unit_label = {"metric": "°C", "imperial": "°F", "standard": "K"}
-units_seen = set()
-
-# read CSV → group by city
-# supports both old logs (temp_c) and new logs (temp + units)
-series = {}  # city -> {"dates": [], "temps": []}
-with csv_path.open("r", encoding="utf-8", newline="") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        city = row.get("city")
-        if not city:
-            continue
-        # date can be ISO date or datetime
-        try:
-            dt = datetime.fromisoformat(row["date"])
-        except Exception:
-            continue
 
-        # temp field fallback: prefer "temp" else use "temp_c"
-        temp_str = row.get("temp") or row.get("temp_c")
-        if temp_str is None:
-            continue
+FIGSIZE = (9, 5)
+DPI = 150
+CHUNK_ROWS = 50_000  # rows parsed per batch; bounds peak memory on huge logs
+
+
+def _to_datetimes(col) -> np.ndarray:
+    """ISO dates/datetimes -> datetime64[s]; unparseable values become NaT."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # "+00:00" offsets: numpy warns, then parses as UTC
         try:
-            temp = float(temp_str)
+            return np.array(col, dtype="datetime64[s]")
         except ValueError:
+            out = np.empty(len(col), dtype="datetime64[s]")
+            for i, v in enumerate(col):
+                try:
+                    out[i] = np.datetime64(v, "s")
+                except ValueError:
+                    out[i] = np.datetime64("NaT")
+            return out
+
+
+def _to_floats(col) -> np.ndarray:
+    """Strings -> float64; blanks/garbage become NaN."""
+    try:
+        return np.array(col, dtype=np.float64)
+    except ValueError:
+        out = np.full(len(col), np.nan)
+        for i, v in enumerate(col):
+            try:
+                out[i] = float(v)
+            except ValueError:
+                pass
+        return out
+
+
+def _convert(temps, units, to: str) -> np.ndarray:
+    """Temps in per-row `units` (array, or one name for all) -> `to`; unknown units are left as they are."""
+    c, d = TO_KELVIN[to]
+    if isinstance(units, str):
+        a, b = TO_KELVIN.get(units, (c, d))
+        return (a * temps + b - d) / c
+    a = np.full(len(temps), c)
+    b = np.full(len(temps), d)
+    for u, (ua, ub) in TO_KELVIN.items():
+        m = units == u
+        a[m], b[m] = ua, ub
+    return (a * temps + b - d) / c
+
+
+def _parse_chunk(rows, ix, names):
+    """
+    Column arrays for one batch of raw CSV rows: (codes, dates, temps °C, units
+    seen), invalid rows dropped. Cities become int codes into `names` ({city:
+    code}, grown as new ones turn up), so no per-row strings outlive the batch.
+    """
+    wanted = [ix[name] for name in ("date", "city", "temp", "temp_c", "units") if name in ix]
+    width = max(wanted) + 1
+    if min(map(len, rows)) < width:  # short rows -> blank (rare: a truncated or hand-edited line)
+        rows = [r if len(r) >= width else r + [""] * (width - len(r)) for r in rows]
+    blank = ("",) * len(rows)
+
+    def col(name):
+        i = ix.get(name)
+        return blank if i is None else list(map(itemgetter(i), rows))  # in C, one column at a time
+
+    cities = col("city")
+    for name in set(cities).difference(names):
+        names[name] = len(names)
+    codes = np.fromiter(map(names.__getitem__, cities), dtype=np.int32, count=len(rows))
+
+    # temp field fallback: prefer "temp" else use "temp_c" (old logs)
+    temp = col("temp") if "temp" in ix else col("temp_c")
+    if "temp" in ix and "temp_c" in ix:  # rare: a log that switched columns mid-way
+        temp = [t or tc for t, tc in zip(temp, col("temp_c"))]
+    temps = _to_floats(temp)
+    dates = _to_datetimes(col("date"))
+    ok = ~np.isnat(dates) & ~np.isnan(temps)
+    if "" in names:
+        ok &= codes != names[""]
+    # units: from column if present; otherwise the legacy temp_c logs were metric
+    units = col("units")
+    seen = set(units)
+    if len(seen) == 1:
+        unit = units[0] or "metric"
+        seen = {unit} if ok.any() else set()
+    else:
+        unit = np.array(units)
+        unit[unit == ""] = "metric"
+        seen = set(np.unique(unit[ok]).tolist())
+    # one axis for mixed-unit logs: every temp is held in CANONICAL_UNITS (°C), converted when drawn
+    temps = _convert(temps, unit, CANONICAL_UNITS)
+    return codes[ok], dates[ok], temps[ok].astype(np.float32), seen
+
+
+def _empty_columns():
+    return [], np.array([], dtype=np.int32), np.array([], dtype="datetime64[s]"), np.array([], dtype=np.float32), set()
+
+
+def _columns(parts, names):
+    """Chunks from _parse_chunk -> (names, codes, dates, temps, units_seen)."""
+    if not parts:
+        return _empty_columns()
+    codes, dates, temps, seen = zip(*parts)
+    return list(names), np.concatenate(codes), np.concatenate(dates), np.concatenate(temps), set().union(*seen)
+
+
+class _Upto(io.RawIOBase):
+    """The binary file `f` from its current position, cut off after `n` bytes."""
+
+    def __init__(self, f, n: int):
+        self.f, self.left = f, n
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.f.readinto(memoryview(b)[:min(len(b), self.left)])
+        self.left -= n
+        return n
+
+
+def read_columns(path=csv_path, start: int = 0, chunk_rows: int = CHUNK_ROWS):
+    """
+    Parse log rows column-wise from byte `start` (0 = right after the header)
+    up to the last complete line. Returns ((names, codes, dates, temps,
+    units_seen), end): each row's city is names[code], temps are float32 in
+    CANONICAL_UNITS, units_seen is what the rows were logged in, and `end` is
+    the byte offset to resume from next time. Invalid rows are dropped.
+    Supports both old logs (temp_c) and new logs (temp + units).
+    """
+    with Path(path).open("rb") as f:
+        header = f.readline()
+        f.seek(0, 2)
+        size = f.tell()
+        f.seek(max(0, size - 65536))
+        last_block = f.read()
+        end = size - len(last_block) + last_block.rfind(b"\n") + 1  # skip a half-written last line
+        start = max(start, len(header))
+        if end <= start:
+            return _empty_columns(), max(end, start)
+
+        cols = next(csv.reader([header.decode("utf-8-sig")]), [])
+        ix = {name: i for i, name in enumerate(cols)}
+        if "city" not in ix or "date" not in ix:
+            return _empty_columns(), end
+
+        f.seek(start)
+        text = io.TextIOWrapper(io.BufferedReader(_Upto(f, end - start), 1 << 20), encoding="utf-8", newline="")
+        reader = csv.reader(text)
+        names, parts = {}, []
+        while rows := list(islice(reader, chunk_rows)):
+            parts.append(_parse_chunk(rows, ix, names))
+            del rows
+
+    return _columns(parts, names), end
+
+
+def columns_from_rows(rows, cols):
+    """What read_columns would return for these raw CSV rows under header `cols`."""
+    ix = {name: i for i, name in enumerate(cols)}
+    if not rows or "city" not in ix or "date" not in ix:
+        return _empty_columns()
+    names = {}
+    return _columns([_parse_chunk(rows, ix, names)], names)
+
+
+def group_by_city(names, codes, dates, temps) -> dict:
+    """{city: (dates, temps)} with each series sorted by date, via one lexsort."""
+    if not len(codes):
+        return {}
+    order = np.lexsort((dates, codes))
+    codes, dates, temps = codes[order], dates[order], temps[order]
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    return {
+        names[c[0]]: (d, t)
+        for c, d, t in zip(np.split(codes, bounds), np.split(dates, bounds), np.split(temps, bounds))
+    }
+
+
+def load_series(path=csv_path, chunk_rows: int = CHUNK_ROWS):
+    """Read the whole log: returns ({city: (dates datetime64[s], temps float32 in °C)}, units_seen)."""
+    (names, codes, dates, temps, units_seen), _ = read_columns(path, 0, chunk_rows)
+    return group_by_city(names, codes, dates, temps), units_seen
+
+
+def downsample(dates, temps, max_points: int):
+    """
+    Aggregate a series that is denser than the plot can show.
+    Returns (x, mean, lo, hi); lo/hi are None when no aggregation was needed.
+    Tries whole days first (daily min/mean/max), then equal time bins.
+    """
+    if len(dates) <= max_points:
+        return dates, temps, None, None
+    days = dates.astype("datetime64[D]")
+    if len(np.unique(days)) <= max_points:
+        bins = days.astype(np.int64)
+    else:
+        t = dates.astype(np.int64)
+        span = max(int(t[-1] - t[0]), 1)
+        bins = (t - t[0]) * (max_points - 1) // span
+    # dates are sorted, so each bin is one contiguous run
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    counts = np.diff(np.r_[starts, len(bins)])
+    mean = np.add.reduceat(temps, starts) / counts
+    lo = np.minimum.reduceat(temps, starts)
+    hi = np.maximum.reduceat(temps, starts)
+    mid = dates[starts] + (dates[starts + counts - 1] - dates[starts]) // 2
+    return mid, mean, lo, hi
+
+
+def chart_units(units_seen, units=None) -> str:
+    """Axis units: as asked, else the log's only unit, else UNITS env (mixed logs), else metric."""
+    if units in TO_KELVIN:
+        return units
+    if len(units_seen) == 1 and next(iter(units_seen)) in TO_KELVIN:
+        return next(iter(units_seen))
+    env = os.getenv("UNITS")
+    return env if env in TO_KELVIN else CANONICAL_UNITS
+
+
+def draw(ax, series, units, max_points: int, title="Daily Temperature by City", legend=True, compact=False):
+    """
+    Plot series (temps in CANONICAL_UNITS) on ax in `units`; shared by the
+    combined and the small per-city charts (compact: short date labels, no x label).
+    """
+    # plot (show single points + tighten axes)
+    xmin = xmax = ymin = ymax = None
+
+    for city, (dates, temps) in sorted(series.items()):
+        if not len(dates):
             continue
+        temps = _convert(temps.astype(np.float64), CANONICAL_UNITS, units)
+        xmin = dates[0] if xmin is None else min(xmin, dates[0])
+        xmax = dates[-1] if xmax is None else max(xmax, dates[-1])
+        ymin = temps.min() if ymin is None else min(ymin, temps.min())
+        ymax = temps.max() if ymax is None else max(ymax, temps.max())
+
+        x, y, lo, hi = downsample(dates, temps, max_points)
+        if len(x) == 1:
+            ax.scatter(x, y, label=city)
+        elif lo is None:
+            ax.plot(x, y, marker="o", linewidth=2, label=city)
+        else:
+            line, = ax.plot(x, y, linewidth=1.5, label=city)
+            ax.fill_between(x, lo, hi, color=line.get_color(), alpha=0.2, linewidth=0)
+
+    # tighten x/y ranges
+    if xmin is not None:
+        pad = np.timedelta64(1, "D")
+        ax.set_xlim(xmin - pad, xmax + pad)
+        ypad = 2
+        ax.set_ylim(ymin - ypad, ymax + ypad)
+
+    # date formatting
+    if compact:
+        locator = mdates.AutoDateLocator(minticks=3, maxticks=6)
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    else:
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))
+        ax.figure.autofmt_xdate()
+
+    # every row is on the same axis now, whatever units it was logged in
+    ax.set_ylabel(f"Temp ({unit_label[units]})")
 
-        # units: from column if present; otherwise infer from legacy column name
-        u = row.get("units")
-        if not u:
-            u = "metric" if "temp_c" in row else "metric"  # safe default
-        units_seen.add(u)
-
-        s = series.setdefault(city, {"dates": [], "temps": []})
-        s["dates"].append(dt)
-        s["temps"].append(temp)
-
-# plot (show single points + tighten axes)
-plt.figure(figsize=(9, 5))
-all_dates, all_temps = [], []
-
-for city, data in sorted(series.items()):
-    pairs = sorted(zip(data["dates"], data["temps"]), key=lambda x: x[0])
-    if not pairs:
-        continue
-    dates, temps = zip(*pairs)
-    all_dates.extend(dates)
-    all_temps.extend(temps)
-
-    if len(dates) == 1:
-        plt.scatter(dates, temps, label=city)
+    ax.set_title(title)
+    if not compact:
+        ax.set_xlabel("Date")
+    ax.grid(True, alpha=0.3)
+    if legend:
+        ax.legend(loc="best")
+
+
+def render(series, units_seen, out=out_path, figsize=FIGSIZE, dpi=DPI, units=None):
+    """series temps are in CANONICAL_UNITS; drawn in chart_units(units_seen, units)."""
+    fig = plt.figure(figsize=figsize)
+    draw(fig.gca(), series, chart_units(units_seen, units), int(figsize[0] * dpi))  # ~one point per pixel
+    fig.tight_layout()
+    Path(out).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(out, dpi=dpi)
+    plt.close(fig)
+    print(f"Saved chart → {out}")
+
+
+def main(src=csv_path, out=out_path, use_cache: bool = True, appended=None, units=None):
+    """
+    `appended`: WeatherLog.last_append from this process, folded in without a re-read.
+    `units`: axis units (default: see chart_units).
+    """
+    if not Path(src).exists():
+        raise SystemExit(f"Missing {src}. Run log_weather_daily.py first.")
+    if use_cache:
+        try:
+            from .chart_cache import load_series_cached
+        except ImportError:
+            from chart_cache import load_series_cached
+        series, units_seen = load_series_cached(src, appended=appended)
     else:
-        plt.plot(dates, temps, marker="o", linewidth=2, label=city)
-
-# tighten x/y ranges
-if all_dates:
-    xmin, xmax = min(all_dates), max(all_dates)
-    pad = timedelta(days=1)
-    plt.xlim(xmin - pad, xmax + pad)
-if all_temps:
-    ypad = 2
-    plt.ylim(min(all_temps) - ypad, max(all_temps) + ypad)
-
-# date formatting
-ax = plt.gca()
-ax.xaxis.set_major_locator(mdates.AutoDateLocator())
-ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))
-plt.gcf().autofmt_xdate()
-
-# y-axis label from units seen
-ylabel = "Temp"
-if len(units_seen) == 1:
-    u = next(iter(units_seen))
-    ylabel = f"Temp ({unit_label.get(u, u)})"
-plt.ylabel(ylabel)
-
-plt.title("Daily Temperature by City")
-plt.xlabel("Date")
-plt.grid(True, alpha=0.3)
-plt.legend(loc="best")
-plt.tight_layout()
-out_path.parent.mkdir(parents=True, exist_ok=True)
-plt.savefig(out_path, dpi=150)
-print(f"Saved chart → {out_path}")
+        series, units_seen = load_series(src)
+    render(series, units_seen, out, units=units)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# week2/city_index.py
+"""
+Persistent city name -> OpenWeather city ID map (SQLite, data/cache/).
+Why: "New York", "new york " and "New York, US" are one place. Once a name
+has been answered we know its ID, so aliases collapse to a single request
+(and the /group endpoint, which takes IDs, can batch them). IDs are learned
+from the `id`/`name` fields of every answer, or bulk-loaded from
+OpenWeather's city.list.json(.gz):
+
+    python week2/city_index.py city.list.json.gz
+"""
+from pathlib import Path
+import gzip, json, os, sqlite3, sys, threading, unicodedata
+
+try:
+    from . import sidecar
+except ImportError:
+    import sidecar
+
+DEFAULT_PATH = Path(__file__).parents[1] / "data" / "cache" / "city-index.sqlite3"
+_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS city_ids (
+    name_key TEXT PRIMARY KEY,
+    city_id  INTEGER NOT NULL,
+    name     TEXT
+);
+"""
+
+
+def name_key(city: str) -> str:
+    """'New  York, US ' -> 'new york,us' (same spelling OpenWeather's q= accepts)."""
+    city = unicodedata.normalize("NFKC", city).casefold()
+    return ",".join(" ".join(part.split()) for part in city.split(","))
+
+
+class CityIndex:
+    def __init__(self, path=None):
+        self.path = Path(path or os.getenv("CITY_INDEX_PATH") or DEFAULT_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=30000")
+        self._db.executescript(_SCHEMA)
+
+    def ids_for(self, cities) -> dict:
+        """{input city: city_id} for every name we already know."""
+        by_key = {}
+        for c in cities:
+            by_key.setdefault(name_key(c), []).append(c)
+        keys = list(by_key)
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _CHUNK):
+                chunk = keys[i:i + _CHUNK]
+                marks = ",".join("?" * len(chunk))
+                for k, cid in self._db.execute(
+                        f"SELECT name_key, city_id FROM city_ids WHERE name_key IN ({marks})", chunk):
+                    for c in by_key[k]:
+                        found[c] = cid
+        return found
+
+    def resolve(self, cities) -> list:
+        """
+        One location per input, in order: the city ID (int) when we know it,
+        else the normalized name. Equal locations are the same place.
+        """
+        ids = self.ids_for(cities)
+        return [ids[c] if c in ids else name_key(c) for c in cities]
+
+    def learn(self, pairs):
+        """pairs: iterable of (input city, payload); remembers IDs of ok payloads."""
+        rows = [(name_key(c), p["id"], p.get("city")) for c, p in pairs
+                if isinstance(c, str) and p.get("ok") and p.get("id") is not None]
+        if rows:
+            self._write(rows)
+
+    def import_city_list(self, path) -> int:
+        """
+        Load OpenWeather's city.list.json(.gz). "Name, CC" is always indexed;
+        a bare "Name" only when it is unambiguous (there are many Springfields).
+        """
+        opener = gzip.open if str(path).endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            cities = json.load(f)
+        rows, bare = [], {}
+        for c in cities:
+            name, cid = c.get("name"), c.get("id")
+            if not name or cid is None:
+                continue
+            if c.get("country"):
+                rows.append((name_key(f"{name},{c['country']}"), cid, name))
+            bare.setdefault(name_key(name), []).append((cid, name))
+        rows += [(k, v[0][0], v[0][1]) for k, v in bare.items() if len(v) == 1]
+        self._write(rows)
+        return len(rows)
+
+    def close(self):
+        self._db.close()
+
+    def _write(self, rows):
+        with self._lock, sidecar.immediate(self._db):
+            self._db.executemany("INSERT OR REPLACE INTO city_ids VALUES (?, ?, ?)", rows)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        raise SystemExit("usage: python week2/city_index.py city.list.json[.gz]")
+    idx = CityIndex()
+    print(f"Indexed {idx.import_city_list(sys.argv[1])} names → {idx.path}")
+    idx.close()
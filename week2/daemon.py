@@ -0,0 +1,358 @@
+# week2/daemon.py
+"""
+`weather serve`: a long-running local daemon with warm pools and a hot cache.
+Why: dashboards call `weather` hundreds of times a minute, and every run
+started cold -- new interpreter, new sessions (TCP + TLS), cache from disk.
+
+The daemon keeps one session per worker thread (connections stay open between
+requests) and an in-memory TTL/LRU cache; identical requests that arrive at
+the same time share one upstream call. It speaks JSON over localhost HTTP:
+
+    POST /weather  {"cities": ["Paris", 2988507], "units": "metric", "max_age": 600}
+                   -> {"results": [payload, ...]}  (same dicts as --json, input order)
+    GET  /health   -> {"ok": true, "pid": ..., "version": ..., "fetch": {"timeout": ..., ...}}
+    GET  /metrics  -> Prometheus text for the daemon's lifetime
+
+While it runs it advertises itself in data/weather-daemon.json; `weather`
+sees that file (a stat, so no cost when no daemon is up), checks /health and
+sends its cities there. WEATHER_DAEMON=host:port points at a daemon directly;
+WEATHER_DAEMON=off or --no-daemon always fetches in-process.
+
+`max_age` is the oldest answer the caller accepts, in seconds: the client sends
+its --cache-ttl with --cache and 0 without, so a run that didn't ask for cached
+answers never gets one (identical requests in flight are still shared). The
+daemon fetches with its own `weather serve` options; /health reports them and a
+run asking for different ones (or its own --mode / --hedge) fetches in-process.
+"""
+from collections import OrderedDict
+from pathlib import Path
+import argparse, json, os, sys, threading, time
+
+try:
+    from . import metrics, rate_limit, weather_cli
+    from .payload import CANONICAL_UNITS, Payload
+except ImportError:
+    import metrics, rate_limit, weather_cli
+    from payload import CANONICAL_UNITS, Payload
+
+DEFAULT_PORT = 8787
+UNITS = ("metric", "imperial", "standard")
+MAX_BODY = 1 << 20  # bytes per POST; the client sends at most LOOKUP_CHUNK cities
+STATE_FILE = Path(__file__).parents[1] / "data" / "weather-daemon.json"
+
+
+def state_file() -> Path:
+    return Path(os.getenv("WEATHER_DAEMON_FILE") or STATE_FILE)
+
+
+# ---------- server ----------
+
+class HotCache:
+    """In-memory TTL + LRU map: cache_key -> payload, servable `stale` s past its TTL. Thread-safe."""
+
+    def __init__(self, ttl: float, max_entries: int, stale: float = 0):
+        self.ttl, self.max_entries, self.stale = ttl, max_entries, stale
+        self._items = OrderedDict()  # key -> (stored, payload), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age=None):
+        """(payload, is_stale), or (None, False) if missing/expired/older than max_age seconds."""
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is None:
+                return None, False
+            age = time.monotonic() - hit[0]
+            if age > self.ttl + self.stale:
+                del self._items[key]
+                return None, False
+            if max_age is not None and age > max_age:
+                return None, False  # too old for this caller; kept for others
+            self._items.move_to_end(key)
+            return hit[1], age > self.ttl
+
+    def set(self, key, payload):
+        with self._lock:
+            self._items[key] = (time.monotonic(), payload)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+class WeatherService:
+    """Fetches through a fixed thread pool whose threads each keep a warm session."""
+
+    def __init__(self, max_workers: int = 8, timeout: int = 10, retries: int = 3, backoff: float = 0.5,
+                 cache_ttl: float = 600, cache_max: int = 20_000, cache_stale: float = 0):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.timeout, self.retries, self.backoff = timeout, retries, backoff
+        self.cache = HotCache(cache_ttl, cache_max, cache_stale)
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="fetch")
+        self._local = threading.local()
+        self._inflight = {}  # cache key -> Future of the request fetching it
+        self._lock = threading.RLock()  # RLock: a finished future's callback runs inline
+        self._cache_key = weather_cli._cache_key()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:  # one per worker thread (requests.Session isn't thread-safe)
+            session = self._local.session = weather_cli._new_session(self.retries, self.backoff)
+        return session
+
+    def settings(self) -> dict:
+        """What shapes an answer here; a client asking for other values fetches in-process."""
+        throttle = rate_limit.current()
+        return {"timeout": self.timeout, "retries": self.retries, "backoff": self.backoff,
+                "rpm": round(throttle.rate * 60, 6) if throttle else 0.0}
+
+    def _fetch(self, city, units):
+        payload = weather_cli.fetch_raw(city, units, self._session(), self.timeout)
+        if payload.get("ok"):
+            self.cache.set(self._cache_key(city, units), payload)
+            if isinstance(payload.get("id"), int):  # next run asks by ID once its index knows the name
+                self.cache.set(self._cache_key(payload["id"], units), payload)
+        return payload
+
+    def submit(self, city, units, max_age=None):
+        """
+        Future of city's payload: a cache hit (no older than max_age seconds, if
+        given), the request already fetching it, or a new one. A stale hit is
+        answered at once and refreshed behind it.
+        """
+        from concurrent.futures import Future
+
+        key = self._cache_key(city, units)
+        with self._lock:
+            hit, stale = self.cache.get(key, max_age)
+            if hit is not None:
+                metrics.inc("weather_cache_hits_total")
+                if stale and key not in self._inflight:
+                    metrics.inc("weather_cache_refreshes_total")
+                    self._start(key, city, units)
+                fut = Future()
+                fut.set_result(hit)
+                return fut
+            fut = self._inflight.get(key)
+            if fut is not None:
+                metrics.inc("weather_daemon_coalesced_total")
+                return fut
+            metrics.inc("weather_cache_misses_total")
+            return self._start(key, city, units)
+
+    def _start(self, key, city, units):
+        fut = self._inflight[key] = self.pool.submit(weather_cli._queued(self._fetch, city, units))
+        fut.add_done_callback(lambda f, k=key: self._forget(k))
+        return fut
+
+    def _forget(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def fetch(self, cities, units, max_age=None):
+        # one upstream call + cache entry per city for every unit system; converted per request
+        futures = [self.submit(c, CANONICAL_UNITS, max_age) for c in cities]
+        return [f.result().to_units(units) for f in futures]
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _parse_request(body: bytes):
+    """(cities, units, max_age) from a POST /weather body; ValueError if malformed."""
+    req = json.loads(body)
+    cities, units, max_age = req.get("cities"), req.get("units", "metric"), req.get("max_age")
+    if not isinstance(cities, list) or units not in UNITS:
+        raise ValueError("expected {\"cities\": [...], \"units\": metric|imperial|standard}")
+    for c in cities:
+        if isinstance(c, bool) or not isinstance(c, (str, int)):
+            raise ValueError(f"bad city: {c!r}")
+    if max_age is not None and (isinstance(max_age, bool) or not isinstance(max_age, (int, float))
+                                or max_age < 0):
+        raise ValueError(f"bad max_age: {max_age!r}")
+    return cities, units, max_age
+
+
+def make_server(service: WeatherService, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+    """ThreadingHTTPServer answering the JSON protocol above (not started)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 128  # dashboards open many short connections at once
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body are two writes: no delayed-ACK wait on keep-alive
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, content_type="application/json"):
+            data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False, default=dict).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"ok": True, "pid": os.getpid(), "version": weather_cli.VERSION,
+                                 "fetch": service.settings()})
+            elif self.path == "/metrics":
+                self._send(200, metrics.REGISTRY.prometheus().encode(), "text/plain; version=0.0.4")
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/weather":
+                return self._send(404, {"error": "not found"})
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY:
+                self.close_connection = True
+                return self._send(413, {"error": "request too large"})
+            try:
+                cities, units, max_age = _parse_request(self.rfile.read(length))
+            except ValueError as e:  # json.JSONDecodeError is a ValueError too
+                return self._send(400, {"error": str(e)})
+            with metrics.timed("weather_daemon_request_seconds"):
+                results = service.fetch(cities, units, max_age)
+            metrics.inc("weather_daemon_requests_total")
+            self._send(200, {"results": results})
+
+    return Server((host, port), Handler)
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, **service_kwargs):
+    """Run until Ctrl+C / SIGTERM; advertises host:port in state_file() meanwhile."""
+    import signal
+
+    weather_cli.settings()  # fail fast on a missing API key
+    service = WeatherService(**service_kwargs)
+    httpd = make_server(service, host, port)
+    host, port = httpd.server_address[:2]
+    state = state_file()
+    state.parent.mkdir(parents=True, exist_ok=True)
+    state.write_text(json.dumps({"host": host, "port": port, "pid": os.getpid()}) + "\n", encoding="utf-8")
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown).start())
+    print(f"weather daemon on http://{host}:{port} (pid {os.getpid()}, Ctrl+C to stop)", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+        try:
+            if json.loads(state.read_text(encoding="utf-8")).get("pid") == os.getpid():
+                state.unlink()
+        except (OSError, ValueError):
+            pass
+
+
+def main(argv=None):
+    """`weather serve [options]`"""
+    weather_cli.load_env()
+    p = argparse.ArgumentParser(prog="weather serve",
+                                description="Keep warm connection pools and a hot cache for `weather`.")
+    p.add_argument("--host", default="127.0.0.1", help="Bind address (default 127.0.0.1, local clients only).")
+    p.add_argument("--port", type=int, default=int(os.getenv("WEATHER_DAEMON_PORT", DEFAULT_PORT)),
+                   help=f"Port (default {DEFAULT_PORT} or WEATHER_DAEMON_PORT env; 0 = any free port).")
+    p.add_argument("--max-workers", type=int, default=int(os.getenv("MAX_WORKERS", "0")) or weather_cli.THREAD_WORKERS,
+                   help="Upstream requests in flight (default 8).")
+    p.add_argument("--timeout", type=int, default=int(os.getenv("TIMEOUT", "10")))
+    p.add_argument("--retries", type=int, default=int(os.getenv("RETRIES", "3")))
+    p.add_argument("--backoff", type=float, default=float(os.getenv("BACKOFF", "0.5")))
+    p.add_argument("--cache-ttl", type=float, default=float(os.getenv("CACHE_TTL", "600")),
+                   help="Seconds an answer is served from memory (default 600 or CACHE_TTL env).")
+    p.add_argument("--cache-max", type=int, default=int(os.getenv("CACHE_MAX", "20000")),
+                   help="Max answers kept in memory; least recently used are evicted.")
+    p.add_argument("--cache-stale", type=float, default=float(os.getenv("CACHE_STALE", "0")),
+                   help="Seconds past --cache-ttl an answer is still served while it is refreshed.")
+    p.add_argument("--rpm", type=float, default=float(os.getenv("RATE_LIMIT", "0")),
+                   help="Max upstream requests per minute (default 0=unlimited or RATE_LIMIT env).")
+    p.add_argument("--burst", type=int, default=int(os.getenv("RATE_BURST", "0")))
+    args = p.parse_args(argv)
+
+    rate_limit.configure(rpm=args.rpm, burst=args.burst, max_concurrency=args.max_workers, backoff=args.backoff)
+    serve(args.host, args.port, max_workers=args.max_workers, timeout=args.timeout, retries=args.retries,
+          backoff=args.backoff, cache_ttl=args.cache_ttl, cache_max=args.cache_max,
+          cache_stale=args.cache_stale)
+
+
+# ---------- client ----------
+
+class DaemonClient:
+    """Talks to a running daemon; http.client only, so the CLI never imports requests for it."""
+
+    def __init__(self, host: str, port: int, timeout: float = 60):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.url = f"http://{host}:{port}"
+        self.settings = {}  # the daemon's fetch options, from /health
+
+    def _call(self, method, path, body=None, timeout=None):
+        import http.client
+
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout or self.timeout)
+        try:
+            conn.request(method, path, body=None if body is None else json.dumps(body).encode(),
+                         headers={"Content-Type": "application/json"})
+            r = conn.getresponse()
+            data = r.read()
+        except http.client.HTTPException as e:  # e.g. a garbled status line; the rest are OSErrors
+            raise OSError(f"daemon: {e!r}") from e
+        finally:
+            conn.close()
+        if r.status != 200:
+            raise OSError(f"daemon answered {r.status}: {data[:140]!r}")
+        return json.loads(data)
+
+    def health(self, timeout=None) -> dict:
+        return self._call("GET", "/health", timeout=timeout)
+
+    def fetch(self, cities, units, max_age=None) -> list:
+        """[Payload] for `cities` (names or int IDs), in order; none cached longer than max_age seconds."""
+        with metrics.timed("weather_daemon_request_seconds"):
+            body = {"cities": cities, "units": units, "max_age": max_age}
+            results = self._call("POST", "/weather", body)["results"]
+        return [Payload.from_dict(p) for p in results]
+
+
+def _address():
+    """(host, port) from WEATHER_DAEMON or the state file; None if disabled / not running."""
+    spec = os.getenv("WEATHER_DAEMON", "").strip()
+    if spec.lower() in ("off", "0", "no", "false"):
+        return None
+    if spec:
+        host, _, port = spec.rpartition(":")
+        try:
+            return host or "127.0.0.1", int(port)
+        except ValueError:
+            print(f"warning: WEATHER_DAEMON={spec!r} is not host:port or off; fetching in-process",
+                  file=sys.stderr)
+            return None
+    try:
+        state = json.loads(state_file().read_text(encoding="utf-8"))
+        return state["host"], int(state["port"])
+    except (OSError, ValueError, KeyError):
+        return None  # no daemon advertised: nothing to probe
+
+
+def connect(timeout: float = 60, probe_timeout: float = 0.5):
+    """A DaemonClient if a daemon of this version answers /health, else None."""
+    addr = _address()
+    if addr is None:
+        return None
+    client = DaemonClient(*addr, timeout=timeout)
+    try:
+        health = client.health(timeout=probe_timeout)
+    except (OSError, ValueError):
+        return None  # stale state file or daemon gone: fetch in-process
+    if health.get("version") != weather_cli.VERSION:
+        return None
+    client.settings = health.get("fetch") or {}
+    return client
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+# week2/group_fetch.py
+"""
+Helpers for OpenWeather's multi-city endpoint: GET /data/2.5/group?id=1,2,...
+One call answers up to 20 city IDs, so big lists cost ~20x fewer requests.
+Each element of the response "list" has the same shape as a /weather answer.
+"""
+import json
+
+GROUP_SIZE = 20  # OpenWeather's per-call limit
+
+
+def group_url(root: str, ids, units: str, key: str) -> str:
+    return f"{root}/group?id={','.join(str(i) for i in ids)}&appid={key}&units={units}"
+
+
+def split_group(body) -> dict:
+    """{city_id: per-city JSON} from a /group response (bytes, str or parsed dict)."""
+    d = json.loads(body) if isinstance(body, (bytes, str)) else body
+    return {item["id"]: item for item in d.get("list", []) if "id" in item}
@@ -0,0 +1,179 @@
+# week2/hedge.py
+"""
+Hedged requests: if a city hasn't answered after a delay, ask again.
+Why: retries only help after a failure; one city stuck near --timeout still
+decided the whole run's wall time, and p99 was a handful of stragglers.
+
+The delay is either fixed (seconds) or a percentile of the fetch times seen so
+far in this run (e.g. p95: once MIN_SAMPLES fetches have finished). A hedge
+goes out only while hedges stay within `budget` x requests started (default
+5%), so a slow upstream never sees more than that much extra load. Whichever
+answer lands first wins; the loser is left to finish on a daemon thread and is
+ignored (it never holds up the end of the run).
+
+While no hedge could go out (too few samples yet, or the budget is spent) a
+call just runs fn() on the caller's thread. Otherwise the primary runs on a
+daemon thread reused from earlier calls (a new one only when none is idle, so
+it never queues behind a loser still finishing; the delay counts from when it
+starts), and a backup -- at most `budget` of calls -- gets a thread of its own.
+"""
+import queue, threading, time
+
+try:
+    from .metrics import Histogram
+    from . import metrics
+except ImportError:
+    from metrics import Histogram
+    import metrics
+
+MIN_SAMPLES = 20  # finished fetches before a percentile delay is trusted
+
+
+def parse_spec(spec: str):
+    """'p95' -> (None, 0.95); '1.5' -> (1.5, None): a percentile or a fixed delay in seconds."""
+    spec = str(spec).strip().lower()
+    if spec.startswith("p"):
+        q = float(spec[1:]) / 100
+        if not 0 < q < 1:
+            raise ValueError(f"percentile must be in p1..p99, got {spec!r}")
+        return None, q
+    delay = float(spec)
+    if delay <= 0:
+        raise ValueError(f"hedge delay must be > 0 seconds, got {spec!r}")
+    return delay, None
+
+
+class Hedger:
+    def __init__(self, spec: str = "p95", budget: float = 0.05):
+        self.fixed, self.quantile = parse_spec(spec)
+        self.budget = budget
+        self.calls = self.hedges = 0
+        self._seen = Histogram()  # fetch times this run
+        self._lock = threading.Lock()
+        self._jobs = None  # queue feeding the reusable primary threads, made on first use
+        self._workers = self._idle = 0
+
+    def delay(self):
+        """Seconds to wait before hedging, or None while too few fetches have finished."""
+        if self.fixed is not None:
+            return self.fixed
+        with self._lock:
+            if self._seen.count < MIN_SAMPLES:
+                return None
+            return self._seen.quantile(self.quantile)
+
+    def _affordable(self) -> bool:
+        """Would the budget cover one more hedge? (caller holds the lock)"""
+        return self.hedges + 1 <= self.budget * self.calls
+
+    def _allow(self) -> bool:
+        with self._lock:
+            if not self._affordable():
+                return False
+            self.hedges += 1
+            return True
+
+    def _timed(self, fn):
+        """fn(), its time (when it returns) recorded for the percentile."""
+        start = time.perf_counter()
+        result = fn()
+        with self._lock:
+            self._seen.observe(time.perf_counter() - start)
+        return result
+
+    def _spawn(self, fn, own_thread: bool = False):
+        """
+        _timed(fn) on an idle reusable thread (started if there is none), or on
+        a new daemon thread of its own; returns (Future, Event set once fn has started).
+        """
+        from concurrent.futures import Future
+
+        fut, started = Future(), threading.Event()
+
+        def run():
+            started.set()
+            try:
+                fut.set_result(self._timed(fn))
+            except BaseException as e:
+                fut.set_exception(e)
+
+        if own_thread:
+            threading.Thread(target=run, name="hedge-backup", daemon=True).start()
+            return fut, started
+        with self._lock:
+            if self._jobs is None:
+                self._jobs = queue.SimpleQueue()
+            if self._idle:
+                self._idle -= 1  # one of the waiting threads takes it
+            else:
+                self._workers += 1
+                threading.Thread(target=self._work, args=(self._jobs,), name=f"hedge-{self._workers}",
+                                 daemon=True).start()
+            self._jobs.put(run)
+        return fut, started
+
+    def _work(self, jobs):
+        while (job := jobs.get()) is not None:
+            job()
+            with self._lock:
+                self._idle += 1
+
+    def close(self):
+        """Let the reusable threads exit once their current job (a loser, say) is done."""
+        with self._lock:
+            jobs, self._jobs = self._jobs, None
+            workers, self._workers, self._idle = self._workers, 0, 0
+        if jobs is not None:
+            for _ in range(workers):
+                jobs.put(None)
+
+    def call(self, fn):
+        """
+        fn() -> payload, run once, and once more if the first call is still
+        out after delay() and the budget allows. fn must be safe to run twice
+        at once on different threads (e.g. it takes the running thread's
+        session). Returns the first ok answer, else the first answer.
+        """
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        with self._lock:
+            self.calls += 1
+            affordable = self._affordable()
+        delay = self.delay()
+        if delay is None or not affordable:
+            return self._timed(fn)  # no hedge could go out: no thread to hand it to
+        primary, started = self._spawn(fn)
+        started.wait()  # the delay is for the request, not for a free thread
+        if wait([primary], timeout=delay).done or not self._allow():
+            return primary.result()
+
+        metrics.inc("weather_hedges_total")
+        backup, _ = self._spawn(fn, own_thread=True)
+        pending = {primary, backup}
+        first = None
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                result = fut.result()
+                if result.get("ok"):
+                    if fut is backup:
+                        metrics.inc("weather_hedge_wins_total")
+                    return result
+                first = first or result
+        return first
+
+
+_shared = None
+
+
+def configure(spec=None, budget: float = 0.05):
+    """Install the process-wide hedger, or remove it (spec None/empty/"off")."""
+    global _shared
+    if _shared is not None:
+        _shared.close()
+    _shared = None if not spec or str(spec).lower() == "off" else Hedger(spec, budget)
+    return _shared
+
+
+def current() -> Hedger | None:
+    return _shared
@@ -0,0 +1,378 @@
+# week2/history.py
+"""
+`weather history`: per-city range queries over the daily log.
+Why: the only way to ask "how warm was Paris in March?" was to load the
+whole CSV into pandas, once per question.
+
+A SQLite sidecar (data/weather_log.history.sqlite3) keeps:
+- readings: one row per (city, date), stored sorted by city then date
+  (WITHOUT ROWID), so a date range is a binary search plus a short scan;
+- rollups: count / sum / min / max of temp (°C) and humidity per city per
+  day ("D") and per month ("M");
+- counts: conditions and 10% humidity bands per city per month.
+
+A range reads whole months from the monthly rollups and only the partial
+months at either end from the daily ones (their counts from a readings scan). Like the log's (date, city) index,
+it remembers how many bytes of each source CSV it has folded in: a query
+first indexes rows appended since (nothing else), and a rewritten or
+truncated source rebuilds it. The legacy weather_log_old.csv (temp_c, no
+units column) is read too; a (city, date) already indexed is not counted twice.
+
+    weather history --city Paris --from 2025-09-01 --to 2025-09-30
+    weather history --city Paris --by month
+    weather history --city Paris --rolling 7 --from 2025-10-01 --json
+"""
+from collections import Counter, deque
+from pathlib import Path
+import argparse, datetime, json, os, sqlite3
+
+try:
+    from . import sidecar, weather_cli
+    from .payload import CANONICAL_UNITS, TO_KELVIN, convert_temp
+except ImportError:
+    import sidecar, weather_cli
+    from payload import CANONICAL_UNITS, TO_KELVIN, convert_temp
+
+repo_root = Path(__file__).parents[1]
+LOG_PATHS = [repo_root / "data" / "weather_log.csv", repo_root / "data" / "weather_log_old.csv"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    city TEXT NOT NULL COLLATE NOCASE,
+    date TEXT NOT NULL,
+    temp REAL NOT NULL,
+    humidity INTEGER,
+    conditions TEXT,
+    PRIMARY KEY (city, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    city TEXT NOT NULL COLLATE NOCASE,
+    grain TEXT NOT NULL,
+    period TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    temp_sum REAL NOT NULL,
+    temp_min REAL NOT NULL,
+    temp_max REAL NOT NULL,
+    hum_n INTEGER NOT NULL,
+    hum_sum REAL NOT NULL,
+    PRIMARY KEY (city, grain, period)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counts (
+    city TEXT NOT NULL COLLATE NOCASE,
+    grain TEXT NOT NULL,
+    period TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (city, grain, period, kind, value)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, offset INTEGER NOT NULL, head TEXT NOT NULL);
+"""
+
+_UPSERT_ROLLUP = """
+INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (city, grain, period) DO UPDATE SET
+    n = n + excluded.n, temp_sum = temp_sum + excluded.temp_sum,
+    temp_min = min(temp_min, excluded.temp_min), temp_max = max(temp_max, excluded.temp_max),
+    hum_n = hum_n + excluded.hum_n, hum_sum = hum_sum + excluded.hum_sum
+"""
+
+_UPSERT_COUNT = """
+INSERT INTO counts VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (city, grain, period, kind, value) DO UPDATE SET n = n + excluded.n
+"""
+
+
+def history_path_for(csv_path) -> Path:
+    """data/weather_log.csv -> data/weather_log.history.sqlite3"""
+    return Path(csv_path).with_suffix(".history.sqlite3")
+
+
+def humidity_band(h: int) -> str:
+    lo = min(max(h, 0) // 10 * 10, 90)
+    return f"{lo}-{100 if lo == 90 else lo + 9}%"
+
+
+def _reading(r: dict):
+    """(city, date, temp °C, humidity, conditions) from one CSV row, or None if unusable."""
+    city, date = (r.get("city") or "").strip(), (r.get("date") or "").strip()
+    try:
+        datetime.date.fromisoformat(date[:10])
+        temp = float(r.get("temp") or r.get("temp_c"))  # temp_c: the legacy log
+    except (TypeError, ValueError):
+        return None
+    if not city:
+        return None
+    units = r.get("units") or "metric"  # the legacy log has no units column and was metric
+    if units in TO_KELVIN:
+        temp = convert_temp(temp, units, CANONICAL_UNITS)
+    try:
+        humidity = int(float(r["humidity"]))
+    except (KeyError, TypeError, ValueError):
+        humidity = None
+    return city, date, temp, humidity, (r.get("conditions") or "").strip() or None
+
+
+def _first_of_next_month(d: datetime.date) -> datetime.date:
+    return (d.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def _pieces(start=None, end=None):
+    """[(grain, lo, hi)] covering [start, end]: whole months as "M", the partial months at either end as "D"."""
+    one = datetime.timedelta(days=1)
+    s = datetime.date.fromisoformat(start) if start else None
+    e = datetime.date.fromisoformat(end) if end else None
+    first = None if s is None else (s if s.day == 1 else _first_of_next_month(s))  # first whole month
+    last = None if e is None else (e if (e + one).day == 1 else e.replace(day=1) - one)  # ends the last one
+    if first is not None and last is not None and first > last:
+        return [("D", start, end)]
+    pieces = [("M", first.isoformat()[:7] if first else "", last.isoformat()[:7] if last else "9999")]
+    if s is not None and s < first:
+        pieces.append(("D", start, (first - one).isoformat()))
+    if e is not None and last < e:
+        pieces.append(("D", (last + one).isoformat(), end))
+    return pieces
+
+
+class HistoryIndex:
+    def __init__(self, sources=LOG_PATHS, path=None):
+        self.sources = [Path(s) for s in sources]
+        self.path = Path(path) if path else history_path_for(self.sources[0])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=30000")
+        self._db.executescript(_SCHEMA)
+
+    # --- catching up with the CSVs ---
+    def sync(self):
+        """Index rows appended to any source since the last call (everything after a rewrite)."""
+        with sidecar.immediate(self._db):  # one indexer at a time across processes
+            self._sync_locked()
+
+    def _sync_locked(self):
+        known = {p: (off, head) for p, off, head in self._db.execute("SELECT path, offset, head FROM sources")}
+        plan, rebuild = [], False
+        for src in self.sources:
+            size, head = sidecar.state(src)
+            offset, old_head = known.get(str(src), (0, ""))
+            if sidecar.changed(size, head, offset, old_head):
+                rebuild = True  # rows gone: rollups can't be un-added, so start over
+            plan.append((src, size, head))
+        if set(known) - {str(src) for src, _, _ in plan}:
+            rebuild = True  # a source was dropped from the list: its rows must go too
+        if rebuild:
+            for table in ("readings", "rollups", "counts", "sources"):
+                self._db.execute(f"DELETE FROM {table}")
+            known = {}
+        for src, size, head in plan:
+            offset = known.get(str(src), (0, ""))[0]
+            if size > offset:
+                self._fold(src, offset, head)
+
+    def _fold(self, src: Path, offset: int, head: str):
+        for rows, pos in sidecar.tail(src, offset):
+            self._add([r for r in map(_reading, rows) if r])
+        self._db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (str(src), pos, head))
+
+    def _add(self, readings):
+        """New readings -> readings + day/month rollups; (city, date) pairs already indexed are skipped."""
+        rollups, counts = {}, Counter()
+        for city, date, temp, humidity, conditions in readings:
+            cur = self._db.execute("INSERT OR IGNORE INTO readings VALUES (?, ?, ?, ?, ?)",
+                                   (city, date, temp, humidity, conditions))
+            if cur.rowcount != 1:
+                continue
+            for grain, period in (("D", date[:10]), ("M", date[:7])):
+                r = rollups.setdefault((city, grain, period), [0, 0.0, temp, temp, 0, 0.0])
+                r[0] += 1
+                r[1] += temp
+                r[2], r[3] = min(r[2], temp), max(r[3], temp)
+                if humidity is not None:
+                    r[4] += 1
+                    r[5] += humidity
+            month = date[:7]  # per-day counts would double the index; partial months scan readings
+            if humidity is not None:
+                counts[(city, "M", month, "humidity", humidity_band(humidity))] += 1
+            if conditions:
+                counts[(city, "M", month, "conditions", conditions)] += 1
+        self._db.executemany(_UPSERT_ROLLUP, [(*k, *v) for k, v in rollups.items()])
+        self._db.executemany(_UPSERT_COUNT, [(*k, n) for k, n in counts.items()])
+
+    # --- queries (call sync() first) ---
+    def cities(self) -> list:
+        return [c for (c,) in self._db.execute("SELECT DISTINCT city FROM rollups WHERE grain = 'M' ORDER BY city")]
+
+    def summary(self, city: str, start=None, end=None):
+        """min / mean / max temp (°C), mean humidity and counts over [start, end]; None if no readings."""
+        n = hum_n = 0
+        temp_sum = hum_sum = 0.0
+        lo = hi = None
+        counts = {"conditions": Counter(), "humidity": Counter()}
+        for grain, a, b in _pieces(start, end):
+            pn, ps, pmin, pmax, phn, phs = self._db.execute(
+                "SELECT SUM(n), SUM(temp_sum), MIN(temp_min), MAX(temp_max), SUM(hum_n), SUM(hum_sum) "
+                "FROM rollups WHERE city = ? AND grain = ? AND period BETWEEN ? AND ?", (city, grain, a, b)).fetchone()
+            if not pn:
+                continue
+            n, temp_sum, hum_n, hum_sum = n + pn, temp_sum + ps, hum_n + phn, hum_sum + phs
+            lo = pmin if lo is None else min(lo, pmin)
+            hi = pmax if hi is None else max(hi, pmax)
+            for kind, value, k in self._counts(city, grain, a, b):
+                counts[kind][value] += k
+        if not n:
+            return None
+        return {"city": self._name(city), "from": start, "to": end, "readings": n,
+                "min": lo, "mean": temp_sum / n, "max": hi,
+                "humidity_mean": hum_sum / hum_n if hum_n else None,
+                "humidity": dict(sorted(counts["humidity"].items())),
+                "conditions": dict(counts["conditions"].most_common())}
+
+    def _counts(self, city, grain, a, b):
+        """(kind, value, n) over whole months a..b ("M") or days a..b ("D", from the readings)."""
+        if grain == "M":
+            return self._db.execute("SELECT kind, value, SUM(n) FROM counts WHERE city = ? AND grain = 'M' "
+                                    "AND period BETWEEN ? AND ? GROUP BY kind, value", (city, a, b)).fetchall()
+        # dates may carry a time: everything from day a up to (not including) the day after b
+        after = (datetime.date.fromisoformat(b) + datetime.timedelta(days=1)).isoformat()
+        out = Counter()
+        for humidity, conditions in self._db.execute(
+                "SELECT humidity, conditions FROM readings WHERE city = ? AND date >= ? AND date < ?",
+                (city, a, after)):
+            if humidity is not None:
+                out["humidity", humidity_band(humidity)] += 1
+            if conditions:
+                out["conditions", conditions] += 1
+        return [(kind, value, n) for (kind, value), n in out.items()]
+
+    def periods(self, city: str, grain: str, start=None, end=None) -> list:
+        """One row per day ("D") or month ("M") with readings in [start, end], in date order."""
+        a = (start or "")[:10 if grain == "D" else 7]
+        b = (end or "9999")[:10 if grain == "D" else 7]
+        rows = self._db.execute(
+            "SELECT period, n, temp_sum, temp_min, temp_max, hum_n, hum_sum FROM rollups "
+            "WHERE city = ? AND grain = ? AND period BETWEEN ? AND ? ORDER BY period", (city, grain, a, b))
+        return [{"period": p, "readings": n, "min": tmin, "mean": ts / n, "max": tmax,
+                 "humidity_mean": hs / hn if hn else None}
+                for p, n, ts, tmin, tmax, hn, hs in rows]
+
+    def rolling(self, city: str, days: int, start=None, end=None) -> list:
+        """Per day with readings: the day's mean and the mean over the trailing `days` calendar days."""
+        before = (datetime.date.fromisoformat(start) - datetime.timedelta(days=days - 1)).isoformat() if start else ""
+        rows = self._db.execute(
+            "SELECT period, n, temp_sum FROM rollups WHERE city = ? AND grain = 'D' AND period BETWEEN ? AND ? "
+            "ORDER BY period", (city, before, end or "9999")).fetchall()
+        window, n, total, out = deque(), 0, 0.0, []
+        for period, pn, ps in rows:
+            day = datetime.date.fromisoformat(period)
+            window.append((day, pn, ps))
+            n, total = n + pn, total + ps
+            while window[0][0] <= day - datetime.timedelta(days=days):
+                _, on, os_ = window.popleft()
+                n, total = n - on, total - os_
+            if not start or period >= start:
+                out.append({"period": period, "mean": ps / pn, "rolling_mean": total / n})
+        return out
+
+    def _name(self, city: str) -> str:
+        row = self._db.execute("SELECT city FROM rollups WHERE city = ? LIMIT 1", (city,)).fetchone()
+        return row[0] if row else city
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------- CLI ----------
+
+def _day(s: str) -> str:
+    """argparse type: YYYY-MM-DD."""
+    try:
+        return datetime.date.fromisoformat(s).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {s!r}")
+
+
+def _in_units(result: dict, units: str) -> dict:
+    """Temps of one result row (°C in the index) -> units, for display."""
+    out = dict(result)
+    for k in ("min", "mean", "max", "rolling_mean"):
+        if k in out:
+            out[k] = round(convert_temp(out[k], CANONICAL_UNITS, units), 2)
+    if out.get("humidity_mean") is not None:
+        out["humidity_mean"] = round(out["humidity_mean"], 1)
+    return out
+
+
+def _print(city, kind, result, units, days=None):
+    label = weather_cli.unit_label(units)
+    t = lambda v: f"{v:.2f}{label}"
+    hum = lambda v: "-" if v is None else f"{v:.0f}%"
+    if kind == "summary":
+        span = f"{result['from'] or 'start'} .. {result['to'] or 'now'}"
+        print(f"{result['city']}  {span}  ({result['readings']} reading{'' if result['readings'] == 1 else 's'})")
+        print(f"  temp        min {t(result['min'])}  mean {t(result['mean'])}  max {t(result['max'])}")
+        bands = ", ".join(f"{b} {n}" for b, n in result["humidity"].items())
+        print(f"  humidity    mean {hum(result['humidity_mean'])}" + (f"  | {bands}" if bands else ""))
+        if result["conditions"]:
+            print("  conditions  " + ", ".join(f"{c} {n}" for c, n in result["conditions"].items()))
+    elif kind == "rolling":
+        print(city)
+        for r in result:
+            print(f"  {r['period']}  {t(r['mean'])}  ({days}-day mean {t(r['rolling_mean'])})")
+    else:
+        print(city)
+        for r in result:
+            print(f"  {r['period']}  n={r['readings']:<4} min {t(r['min'])}  mean {t(r['mean'])}  "
+                  f"max {t(r['max'])}  humidity {hum(r['humidity_mean'])}")
+
+
+def main(argv=None):
+    """`weather history [options]`"""
+    weather_cli.load_env()
+    p = argparse.ArgumentParser(prog="weather history",
+                                description="Per-city stats over the logged history (indexed, no full CSV scan).")
+    p.add_argument("--city", action="append", help="City to report (repeatable; default every logged city).")
+    p.add_argument("--from", dest="start", type=_day, help="First day, YYYY-MM-DD (default: the first reading).")
+    p.add_argument("--to", dest="end", type=_day, help="Last day, YYYY-MM-DD (default: the latest reading).")
+    p.add_argument("--by", choices=["day", "month"], help="One line per day / month instead of one summary.")
+    p.add_argument("--rolling", type=int, metavar="DAYS",
+                   help="Daily mean plus its trailing DAYS-day average.")
+    p.add_argument("--units", choices=sorted(TO_KELVIN), default=os.getenv("UNITS", "metric"),
+                   help="Display units (mixed-unit logs are converted; default UNITS env or metric).")
+    p.add_argument("--json", action="store_true", help="JSON lines instead of text.")
+    p.add_argument("--log", action="append",
+                   help="Source CSV (repeatable; default data/weather_log.csv + data/weather_log_old.csv).")
+    args = p.parse_args(argv)
+    if args.start and args.end and args.start > args.end:
+        p.error("--from is after --to")
+    if args.rolling is not None and args.rolling < 1:
+        p.error("--rolling needs at least 1 day")
+
+    sources = args.log or [s for s in LOG_PATHS if s.exists()] or LOG_PATHS[:1]
+    with HistoryIndex(sources, None if args.log else history_path_for(LOG_PATHS[0])) as index:
+        index.sync()
+        for city in args.city or index.cities():
+            if args.rolling:
+                kind, result = "rolling", index.rolling(city, args.rolling, args.start, args.end)
+            elif args.by:
+                kind, result = "periods", index.periods(city, "D" if args.by == "day" else "M", args.start, args.end)
+            else:
+                kind, result = "summary", index.summary(city, args.start, args.end)
+            if not result:
+                print(f"{city}: no readings" + (" in that range" if args.start or args.end else ""))
+                continue
+            result = _in_units(result, args.units) if kind == "summary" else [_in_units(r, args.units) for r in result]
+            if args.json:
+                print(json.dumps({"city": city, "units": args.units, kind: result}, ensure_ascii=False))
+            else:
+                _print(city, kind, result, args.units, args.rolling)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,108 @@
 """
 HTTP utilities: a configured requests.Session with retries & backoff.
 Why: connection pooling + resilience against temporary failures.
+
+With a shared rate_limit.Throttle, retries move out of urllib3 and into
+ThrottledAdapter, so every attempt (first try *and* retry) waits for the
+process-wide token bucket / concurrency limit and reports back to it.
+
+Every adapter here is a TimedAdapter: each attempt's connect/TLS/TTFB time,
+status and retries land in the metrics registry.
 """
 from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from urllib3.util.retry import Retry
-import requests
+import requests, time
+
+try:
+    from .rate_limit import retry_after_seconds
+    from . import metrics
+except ImportError:
+    from rate_limit import retry_after_seconds
+    import metrics
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def _new_conn(self):
+        start = time.perf_counter()
+        sock = super()._new_conn()  # DNS + TCP connect
+        self._connect_seconds = time.perf_counter() - start
+        metrics.observe("weather_http_connect_seconds", self._connect_seconds)
+        metrics.inc("weather_http_connections_total")
+        return sock
+
+
+class _TimedHTTPSConnection(_TimedHTTPConnection, HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()  # _new_conn() + TLS handshake
+        metrics.observe("weather_http_tls_seconds", time.perf_counter() - start - getattr(self, "_connect_seconds", 0.0))
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter that records per-attempt timings, statuses and retries."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool,
+                                                   "https": _TimedHTTPSConnectionPool}
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        try:
+            resp = super().send(request, **kwargs)  # returns once headers are in (body not read yet)
+        except requests.RequestException as e:
+            metrics.inc("weather_http_errors_total", kind=e.__class__.__name__)
+            raise
+        metrics.observe("weather_http_ttfb_seconds", time.perf_counter() - start)
+        metrics.inc("weather_http_responses_total", status=resp.status_code)
+        retries = getattr(resp.raw, "retries", None)  # urllib3's own retries (unthrottled sessions)
+        if retries is not None and retries.history:
+            metrics.inc("weather_http_retries_total", len(retries.history))
+        return resp
+
+
+class ThrottledAdapter(TimedAdapter):
+    """HTTPAdapter whose retry loop goes through a shared Throttle."""
+
+    def __init__(self, throttle, total: int, status_forcelist, **kwargs):
+        self.throttle, self.total, self.status_forcelist = throttle, total, status_forcelist
+        super().__init__(max_retries=Retry(total=0, raise_on_status=False), **kwargs)
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            with metrics.timed("weather_throttle_wait_seconds"):
+                sent = self.throttle.enter()
+            try:
+                resp = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.throttle.exit(sent)
+                if attempt >= self.total:
+                    raise
+                wait = None
+            except BaseException:  # InvalidURL, urllib3 errors, KeyboardInterrupt...: every enter() gets its exit()
+                self.throttle.exit(sent, adapt=False)
+                raise
+            else:
+                wait = retry_after_seconds(resp.headers)
+                self.throttle.exit(sent, resp.status_code, wait)
+                if resp.status_code not in self.status_forcelist or attempt >= self.total:
+                    return resp
+                resp.close()
+            attempt += 1
+            metrics.inc("weather_http_retries_total")
+            time.sleep(self.throttle.backoff(attempt - 1, wait))
+
 
 def make_session(
     total: int = 3,
@@ -13,8 +111,22 @@ def make_session(
     status_forcelist = (429, 500, 502, 503, 504),
     allowed_methods = ("GET", "POST"),
     user_agent: str = "weather-cli/0.1",
+    throttle=None,
 ) -> requests.Session:
-    retry = Retry(
+    if throttle is not None:
+        adapter = ThrottledAdapter(throttle, total, status_forcelist)
+    else:
+        adapter = TimedAdapter(max_retries=_retry(total, backoff, status_forcelist, allowed_methods))
+
+    s = requests.Session()
+    s.headers.update({"User-Agent": user_agent})
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+def _retry(total, backoff, status_forcelist, allowed_methods) -> Retry:
+    return Retry(
         total=total,
         connect=total,
         read=total,
@@ -24,11 +136,3 @@ def make_session(
         raise_on_status=False,
         respect_retry_after_header=True, # honor server Retry-After
     )
-
-    adapter = HTTPAdapter(max_retries=retry)
-
-    s = requests.Session()
-    s.headers.update({"User-Agent": user_agent})
-    s.mount("http://", adapter)
-    s.mount("https://", adapter)
-    return s
@@ -0,0 +1,131 @@
+# week2/log_store.py
+"""
+Append-only weather log: data/weather_log.csv + a persistent (date, city) index.
+Why: both writers used to read the whole CSV on every run just to de-dupe.
+
+The CSV stays the source of truth (same columns, still opens in Excel/pandas).
+The sidecar index (weather_log.idx.sqlite3) remembers which keys exist and how
+many bytes of the CSV it has covered, so opening the log only reads rows
+appended since (e.g. by an older script), not the whole history. If the CSV
+was rewritten or truncated, the index is rebuilt from scratch.
+"""
+from pathlib import Path
+import csv, io, sqlite3
+
+try:
+    from . import sidecar
+except ImportError:
+    import sidecar
+
+FIELDS = ["date", "city", "temp", "units", "humidity", "feels_like", "conditions"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS keys (
+    date TEXT NOT NULL,
+    city TEXT NOT NULL,
+    PRIMARY KEY (date, city)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT);
+"""
+
+
+def log_row(date: str, payload) -> dict:
+    """CSV row for one ok fetch Payload (or its dict form)."""
+    return {"date": date, **{k: payload.get(k) for k in FIELDS[1:]}}
+
+
+class WeatherLog:
+    def __init__(self, csv_path, fields=FIELDS):
+        self.path = Path(csv_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fields = fields
+        self.last_append = None  # (start, end, rows) of the latest write; see _append_locked
+        self._db = sqlite3.connect(self.path.with_suffix(".idx.sqlite3"), timeout=30,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=30000")
+        self._db.executescript(_SCHEMA)
+        self._tx(lambda: None)  # catch up with anything appended behind our back
+
+    # --- queries ---
+    def has(self, date: str, city: str) -> bool:
+        return self._db.execute("SELECT 1 FROM keys WHERE date = ? AND city = ?",
+                                (date, city)).fetchone() is not None
+
+    def cities_on(self, date: str) -> set:
+        return {c for (c,) in self._db.execute("SELECT city FROM keys WHERE date = ?", (date,))}
+
+    # --- writes ---
+    def append(self, row: dict) -> bool:
+        """Append one row unless (date, city) is already logged. True if written."""
+        return self.append_many([row])[0]
+
+    def append_many(self, rows) -> list:
+        rows = list(rows)
+        return self._tx(lambda: self._append_locked(rows)) if rows else []
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- internals ---
+    def _tx(self, fn):
+        # one writer at a time across processes; the CSV append and the index
+        # update happen under the same lock
+        with sidecar.immediate(self._db):
+            self._sync_locked()
+            return fn()
+
+    def _meta(self, k):
+        row = self._db.execute("SELECT v FROM meta WHERE k = ?", (k,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, k, v):
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (k, str(v)))
+
+    def _sync_locked(self):
+        """Index CSV bytes past the stored offset (all of them after a rewrite)."""
+        size, head = sidecar.state(self.path)
+        offset = int(self._meta("offset") or 0)
+        if sidecar.changed(size, head, offset, self._meta("head")):
+            self._db.execute("DELETE FROM keys")
+            offset = 0
+        if size == offset:
+            return
+        for rows, pos in sidecar.tail(self.path, offset):
+            self._db.executemany("INSERT OR IGNORE INTO keys VALUES (?, ?)",
+                                 [(r["date"], r["city"]) for r in rows if r.get("date") and r.get("city")])
+        self._set_meta("offset", pos)
+        self._set_meta("head", head)
+
+    def _append_locked(self, rows):
+        new = not self.path.exists() or self.path.stat().st_size == 0
+        written, lines = [], []
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=self.fields, extrasaction="ignore")
+        if new:
+            writer.writeheader()
+        for row in rows:
+            cur = self._db.execute("INSERT OR IGNORE INTO keys VALUES (?, ?)",
+                                   (row["date"], row["city"]))
+            ok = cur.rowcount == 1
+            if ok:
+                writer.writerow(row)
+                lines.append(["" if row.get(k) is None else str(row[k]) for k in self.fields])
+            written.append(ok)
+        if any(written) or new:
+            start = 0 if new else self.path.stat().st_size
+            with self.path.open("a", newline="", encoding="utf-8") as f:
+                f.write(buf.getvalue())
+            end = self.path.stat().st_size
+            # byte span + the rows as written, so a reader that already covers
+            # [0, start) (the chart cache) can fold them in without re-reading
+            self.last_append = (start, end, lines)
+            self._set_meta("offset", end)
+            self._set_meta("head", sidecar.head_hash(self.path))
+        return written
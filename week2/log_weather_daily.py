@@ -1,66 +1,104 @@
+# week2/log_weather_daily.py
+"""
+Daily logger: today's weather for CITIES -> data/weather_log.csv.
+Why: importable, so run_log_and_chart runs it in-process, and it fetches
+through weather_cli's pooled, parallel path (retries, shared throttle, one
+request per unique city) instead of a fresh requests.get per city.
+
+Big lists go through sweep.py: hash-sharded, checkpointed, merged afterwards.
+
+    python week2/log_weather_daily.py                                   # CITIES -> daily log
+    python week2/log_weather_daily.py --cities-file all.txt --shard 3/8 # one shard (resumable)
+    python week2/log_weather_daily.py --merge                           # shards -> daily log
+"""
 from pathlib import Path
-from dotenv import load_dotenv
-import os, requests, csv, datetime
+import argparse, datetime, os
 
-# Load .env that lives in THIS folder (week2/.env)
-load_dotenv(Path(__file__).with_name(".env"))
-KEY = os.getenv("OPENWEATHER_API_KEY") or exit("Missing OPENWEATHER_API_KEY in week2/.env")
+try:
+    from . import weather_cli
+    from .log_store import WeatherLog, log_row
+    from . import sweep
+except ImportError:
+    import weather_cli                       # when running: python week2/log_weather_daily.py
+    from log_store import WeatherLog, log_row
+    import sweep
 
 CITIES = ["Seattle", "London", "Tokyo"]         # change as you like
-UNITS  = os.getenv("UNITS", "imperial")         # metric / imperial / standard
-UNIT_LABEL = {"metric": "°C", "imperial": "°F", "standard": "K"}.get(UNITS, "")
+DEFAULT_UNITS = "imperial"                      # UNITS env: metric / imperial / standard
 
 # repo_root/data/weather_log.csv (works no matter where you run from)
 repo_root = Path(__file__).parents[1]
 log_path = repo_root / "data" / "weather_log.csv"
-log_path.parent.mkdir(parents=True, exist_ok=True)
 
-def fetch(city: str):
-    url = f"https://api.openweathermap.org/data/2.5/weather?q={city}&appid={KEY}&units={UNITS}"
-    try:
-        r = requests.get(url, timeout=20)
-    except requests.exceptions.RequestException as e:
-        return None, f"{city}: network error: {e}"
-    if r.status_code != 200:
-        return None, f"{city}: error {r.status_code}"
-    try:
-        d = r.json()
-        return {
-            "date": datetime.date.today().isoformat(),
-            "city": d.get("name", city),
-            "temp": d["main"]["temp"],          # unified temp column
-            "units": UNITS,                     # write units per row
-            "humidity": d["main"]["humidity"],
-            "feels_like": d["main"]["feels_like"],
-            "conditions": (d["weather"][0]["description"] if d.get("weather") else None),
-        }, None
-    except Exception as e:
-        return None, f"{city}: bad JSON: {e}"
 
-# simple de-dupe: don't append if (date, city) already exists
-existing = set()
-if log_path.exists():
-    with log_path.open("r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            existing.add((row.get("date"), row.get("city")))
+def log_daily(cities=CITIES, units: str = None, path=log_path, mode: str = "auto", max_workers: int = 0):
+    """
+    Fetch `cities` in parallel (fetch engine `mode`, as --mode) and append
+    today's rows, skipping (date, city) pairs already logged. Prints one line
+    per city, like the old script.
+    Returns WeatherLog.last_append -- (start, end, rows) -- or None if nothing
+    was written, so the chart can take the fresh rows from memory.
+    """
+    weather_cli.load_env()
+    units = units or os.getenv("UNITS", DEFAULT_UNITS)
+    label = weather_cli.unit_label(units)
+    today = datetime.date.today().isoformat()
+
+    results = weather_cli.fetch_weather(cities, units, mode=mode, timeout=20, max_workers=max_workers)
+    rows = []
+    for city, payload in results:
+        if payload.get("ok"):
+            rows.append(log_row(today, payload))
+        else:
+            print(f"{city}: {payload['error']}")
+
+    # de-dupe via the log's persistent (date, city) index -- no full CSV scan
+    with WeatherLog(path) as log:
+        for row, written in zip(rows, log.append_many(rows)):
+            if not written:
+                print(f"Skip {row['city']} (already logged for {row['date']})")
+                continue
+            print(f"Logged {row['city']}: {row['temp']:.2f}{label}, {row['conditions']}")
+        return log.last_append
+
+
+def main(argv=None):
+    weather_cli.load_env()
+    p = argparse.ArgumentParser(description="Log today's weather (CITIES, or a sharded sweep of a city list).")
+    p.add_argument("--cities-file", help="Sweep this list (one city per line) instead of CITIES.")
+    p.add_argument("--shard", type=sweep.parse_shard, default=None,
+                   help="Take shard i of N (e.g. 3/8) of --cities-file; resumes from its checkpoint.")
+    p.add_argument("--merge", action="store_true",
+                   help="Fold the day's shard outputs into the daily log (after sweeping, if asked to).")
+    p.add_argument("--date", default=datetime.date.today().isoformat(),
+                   help="Sweep day (default today); pins the checkpoint dir for a run that crosses midnight.")
+    p.add_argument("--sweep-dir", default=os.getenv("SWEEP_DIR", sweep.SWEEP_DIR),
+                   help="Shard outputs + checkpoints (default data/sweeps, or SWEEP_DIR env; may be shared).")
+    p.add_argument("--log", default=log_path, help="Daily log to write / merge into (default data/weather_log.csv).")
+    p.add_argument("--units", default=os.getenv("UNITS", DEFAULT_UNITS), choices=["metric", "imperial", "standard"])
+    p.add_argument("--mode", default=os.getenv("FETCH_MODE", "auto"),
+                   choices=["auto", "sequential", "thread", "async", "group"])
+    p.add_argument("--max-workers", type=int, default=int(os.getenv("MAX_WORKERS", "0")),
+                   help="Parallel requests (0=auto).")
+    args = p.parse_args(argv)
+
+    if not (args.cities_file or args.shard or args.merge):
+        log_daily(units=args.units, path=args.log, mode=args.mode, max_workers=args.max_workers)
+        return
+
+    if args.cities_file or args.shard:
+        if not args.cities_file:
+            p.error("--shard needs --cities-file")
+        i, n = args.shard or (0, 1)
+        stats = sweep.sweep(weather_cli.iter_cities(cities_file=args.cities_file), (i, n), args.date,
+                            args.units, args.sweep_dir, mode=args.mode, timeout=20, max_workers=args.max_workers)
+        print(f"shard {i}/{n}: {stats['logged']} logged, {stats['duplicate']} already in shard, "
+              f"{stats['resumed']} done by an earlier run, {stats['failed']} failed (retried next run)")
+    if args.merge:
+        stats = sweep.merge(args.log, args.date, args.sweep_dir)
+        print(f"merged {stats['shards']} shard(s) into {args.log}: {stats['logged']} new rows, "
+              f"{stats['duplicate']} already logged")
 
-wrote_header = log_path.exists()
-with log_path.open("a", newline="", encoding="utf-8") as f:
-    fieldnames = ["date", "city", "temp", "units", "humidity", "feels_like", "conditions"]
-    writer = csv.DictWriter(f, fieldnames=fieldnames)
-    if not wrote_header:
-        writer.writeheader()
 
-    for c in CITIES:
-        row, err = fetch(c)
-        if err:
-            print(err)
-            continue
-        key = (row["date"], row["city"])
-        if key in existing:
-            print(f"Skip {row['city']} (already logged for {row['date']})")
-            continue
-        writer.writerow(row)
-        existing.add(key)  # catch duplicates within the same run
-        print(f"Logged {row['city']}: {row['temp']:.2f}{UNIT_LABEL}, {row['conditions']}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# week2/metrics.py
+"""
+Per-run metrics: counters, gauges and latency histograms for one process.
+Why: the run log is free text, so "where did the time go?" (connect, TTFB,
+retries, queue wait, cache, CSV) had no answer and slow runs couldn't alert.
+
+Always on and cheap (a lock + a bucket increment per observation); memory is
+fixed-size however many cities run. Exported as a JSON summary (--metrics)
+or a Prometheus textfile for node_exporter's textfile collector (--metrics-prom).
+
+Histograms use fixed buckets (seconds), so p50/p95/p99 are interpolated
+estimates, like Prometheus' histogram_quantile(); min/max are exact.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+import math, os, threading, time
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "weather_fetch_seconds": "One city's fetch, retries included (excludes queue wait).",
+    "weather_http_ttfb_seconds": "One HTTP attempt: request sent until response headers (incl. connect if new).",
+    "weather_http_connect_seconds": "New connection: DNS + TCP connect (async engine: + TLS).",
+    "weather_http_tls_seconds": "New connection: TLS handshake.",
+    "weather_http_dns_seconds": "DNS lookup (async engine only; cached lookups not counted).",
+    "weather_queue_wait_seconds": "Time a city waited for a free worker.",
+    "weather_throttle_wait_seconds": "Time an attempt waited on the shared rate limiter.",
+    "weather_session_create_seconds": "Creating a requests.Session.",
+    "weather_cache_lookup_seconds": "One response-cache lookup batch.",
+    "weather_cache_write_seconds": "One response-cache write.",
+    "weather_csv_write_seconds": "One CSV append (row or batch).",
+    "weather_daemon_request_seconds": "One POST /weather to the daemon (client: round trip; daemon: handling).",
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last bucket = +Inf
+        self.count, self.sum, self.min, self.max = 0, 0.0, math.inf, 0.0
+
+    def observe(self, v: float):
+        self.counts[bisect_left(BUCKETS, v)] += 1
+        self.count += 1
+        self.sum += v
+        self.min = min(self.min, v)
+        self.max = max(self.max, v)
+
+    def quantile(self, q: float):
+        """Linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = max(BUCKETS[i - 1] if i else 0.0, self.min)
+                hi = min(BUCKETS[i] if i < len(BUCKETS) else self.max, self.max)
+                return lo + (hi - lo) * max(0.0, rank - seen) / n
+            seen += n
+        return self.max
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def _fmt(name, labels):
+    if not labels:
+        return name
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return f"{name}{{{inner}}}"
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters, self.gauges, self.histograms = {}, {}, {}
+
+    # --- recording ---
+    def inc(self, name: str, n: float = 1, **labels):
+        k = _key(name, labels)
+        with self._lock:
+            self.counters[k] = self.counters.get(k, 0) + n
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            h = self.histograms.get(name)
+            if h is None:
+                h = self.histograms[name] = Histogram()
+            h.observe(seconds)
+
+    @contextmanager
+    def timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    # --- export ---
+    def summary(self) -> dict:
+        """JSON-friendly snapshot: {"counters", "gauges", "histograms"} (ms for latencies)."""
+        ms = lambda v: None if v is None else round(v * 1000, 3)
+        with self._lock:
+            return {
+                "counters": {_fmt(n, l): v for (n, l), v in sorted(self.counters.items())},
+                "gauges": {_fmt(n, l): v for (n, l), v in sorted(self.gauges.items())},
+                "histograms": {
+                    name: {
+                        "count": h.count,
+                        "sum_ms": ms(h.sum),
+                        "min_ms": ms(h.min if h.count else None),
+                        "p50_ms": ms(h.quantile(0.50)),
+                        "p95_ms": ms(h.quantile(0.95)),
+                        "p99_ms": ms(h.quantile(0.99)),
+                        "max_ms": ms(h.max if h.count else None),
+                    }
+                    for name, h in sorted(self.histograms.items())
+                },
+            }
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format (counters, gauges, histograms in seconds)."""
+        out, typed = [], set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in HELP:
+                    out.append(f"# HELP {name} {HELP[name]}")
+                out.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), v in sorted(self.counters.items()):
+                header(name, "counter")
+                out.append(f"{_fmt(name, labels)} {v}")
+            for (name, labels), v in sorted(self.gauges.items()):
+                header(name, "gauge")
+                out.append(f"{_fmt(name, labels)} {v}")
+            for name, h in sorted(self.histograms.items()):
+                header(name, "histogram")
+                cumulative = 0
+                for le, n in zip([*BUCKETS, "+Inf"], h.counts):
+                    cumulative += n
+                    out.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+                out.append(f"{name}_sum {h.sum}")
+                out.append(f"{name}_count {h.count}")
+        return "\n".join(out) + "\n"
+
+    def write_textfile(self, path):
+        """Atomic write (tmp + rename) so node_exporter never reads half a file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+        tmp.write_text(self.prometheus(), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+REGISTRY = Metrics()  # process-wide; every module records into this one
+inc, set_gauge, observe, timed = REGISTRY.inc, REGISTRY.set, REGISTRY.observe, REGISTRY.timed
@@ -0,0 +1,104 @@
+# week2/payload.py
+"""
+Payload: one fetch result as a slotted record instead of a 7-8 key dict.
+Why: every engine, the reorder buffer, the recent-answers map, the daemon's
+hot cache and fetch_weather's result list each held one dict per city; on
+big sweeps those dicts (and a fresh "clear sky" string per answer) were a
+large share of the run's memory.
+
+A Payload reads like the old dict -- p["temp"], p.get("ok"), {**p},
+dict(p) -- so callers and the --json / CSV / cache formats are unchanged.
+Only the fields the CLI uses are lifted out of the OpenWeather answer;
+short, repetitive strings (units, conditions) are interned.
+
+Units: everything is fetched and cached in CANONICAL_UNITS; to_units()
+converts locally, so metric and imperial runs share one cache and one
+request per city.
+"""
+from collections.abc import Mapping
+import sys
+
+OK_FIELDS = ("ok", "city", "id", "units", "temp", "feels_like", "humidity", "conditions")
+ERROR_FIELDS = ("ok", "city", "units", "error")
+
+CANONICAL_UNITS = "metric"  # what we ask the API for and keep in the caches
+# units -> (a, b) with kelvin = a * value + b
+TO_KELVIN = {"metric": (1.0, 273.15), "imperial": (5 / 9, 273.15 - 32 * 5 / 9), "standard": (1.0, 0.0)}
+
+
+def convert_temp(value, units: str, to: str):
+    """A temperature in `units` -> `to`, rounded to 0.01 like the API's own answers."""
+    if value is None or units == to:
+        return value
+    a, b = TO_KELVIN[units]
+    c, d = TO_KELVIN[to]
+    return round((a * value + b - d) / c, 2)
+
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+
+class Payload(Mapping):
+    """A normalized answer for one city: ok with data, or not ok with an error."""
+
+    __slots__ = OK_FIELDS + ("error",)
+
+    def __init__(self, ok: bool, city, units: str, id=None, temp=None, feels_like=None,
+                 humidity=None, conditions=None, error=None):
+        self.ok, self.city, self.units = ok, city, _intern(units)
+        self.id, self.temp, self.feels_like, self.humidity = id, temp, feels_like, humidity
+        self.conditions, self.error = _intern(conditions), error
+
+    @classmethod
+    def failed(cls, city, units: str, error: str) -> "Payload":
+        return cls(False, city, units, error=error)
+
+    @classmethod
+    def from_current(cls, d: dict, city, units: str) -> "Payload":
+        """The fields we keep from a parsed /weather answer (or one /group item); KeyError if missing."""
+        main = d["main"]
+        weather = d.get("weather")
+        return cls(True, d.get("name", city), units, id=d.get("id"), temp=main["temp"],
+                   feels_like=main["feels_like"], humidity=main["humidity"],
+                   conditions=weather[0]["description"] if weather else None)
+
+    @classmethod
+    def from_dict(cls, d) -> "Payload":
+        """Back from its dict form (the cache row, the daemon's JSON)."""
+        if isinstance(d, cls):
+            return d
+        if not d.get("ok"):
+            return cls.failed(d.get("city"), d.get("units"), d.get("error", "unknown"))
+        return cls(True, d.get("city"), d.get("units"), id=d.get("id"), temp=d.get("temp"),
+                   feels_like=d.get("feels_like"), humidity=d.get("humidity"), conditions=d.get("conditions"))
+
+    def replace(self, **changes) -> "Payload":
+        return Payload(**{**{k: getattr(self, k) for k in self.__slots__}, **changes})
+
+    def to_units(self, units: str) -> "Payload":
+        """The same answer in `units` (temp and feels_like converted; nothing else depends on units)."""
+        if units == self.units:
+            return self
+        if not self.ok:
+            return self.replace(units=units)
+        return self.replace(units=units, temp=convert_temp(self.temp, self.units, units),
+                            feels_like=convert_temp(self.feels_like, self.units, units))
+
+    # --- read like the dict it replaces ---
+    def _fields(self):
+        return OK_FIELDS if self.ok else ERROR_FIELDS
+
+    def __getitem__(self, key):
+        if key not in self._fields():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self._fields())
+
+    def __len__(self):
+        return len(self._fields())
+
+    def __repr__(self):
+        return f"Payload({dict(self)!r})"
@@ -0,0 +1,54 @@
+# week2/pipeline.py
+"""
+Bounded streaming helpers shared by the fetch engines.
+Why: a 1,000,000-line --cities-file should cost the same memory as a 100-line
+one -- read input lazily, keep a fixed number of requests in flight, hand
+results on as they finish.
+"""
+from itertools import islice
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+
+def chunks(iterable, size: int):
+    """Lists of up to `size` items, read lazily."""
+    it = iter(iterable)
+    while block := list(islice(it, size)):
+        yield block
+
+
+def done(value) -> "Future":
+    """An already-finished future (e.g. a cache hit) so it flows through pump()."""
+    from concurrent.futures import Future
+
+    fut = Future()
+    fut.set_result(value)
+    return fut
+
+
+def pump(items, submit, window: int):
+    """
+    Call submit(item) -> Future for each item, keeping at most `window` futures
+    unfinished; yield (item, result) in completion order. `items` is only
+    pulled when there is room, so input is never read ahead of the window.
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    pending = {}
+    it = iter(items)
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < window:
+            try:
+                item = next(it)
+            except StopIteration:
+                exhausted = True
+                break
+            pending[submit(item)] = item
+        if not pending:
+            return
+        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in finished:
+            yield pending.pop(fut), fut.result()
@@ -0,0 +1,112 @@
+# week2/rate_limit.py
+"""
+Process-wide request throttle: token bucket + adaptive (AIMD) concurrency.
+Why: with per-session urllib3 retries, every worker backs off on its own and
+they all come back at the same moment after a 429 -- a synchronized retry storm.
+
+One Throttle is shared by every worker (threads, /group batches, asyncio):
+- token bucket: at most `rpm` requests per minute (0 = unlimited) -- set it to
+  your OpenWeather plan's limit; `burst` requests may go out back to back
+- Retry-After: a 429 pauses *everyone* until the server's hint expires
+- AIMD: allowed in-flight requests halve on 429/5xx and grow back by ~1 per
+  window of successes, between 1 and max_concurrency. Like TCP, a burst of
+  failures only counts once: requests sent before the last cut can't cut again
+- retries sleep with full jitter, so workers don't re-align
+"""
+import random, threading, time
+
+THROTTLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class Throttle:
+    def __init__(self, rpm: float = 0, burst: int = 0, max_concurrency: int = 8,
+                 min_concurrency: int = 1, backoff: float = 0.5):
+        self.rate = rpm / 60.0                     # tokens per second (0 = no bucket)
+        self.capacity = float(burst or max(1.0, self.rate))  # default: about one second's worth
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.backoff_factor = backoff
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = -1.0
+        self._cond = threading.Condition()
+
+    # --- before a request ---
+    def reserve(self) -> float:
+        """Claim a token; returns how long to sleep before sending (0 = go now)."""
+        with self._cond:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self.rate:
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                self._tokens -= 1                  # may go negative = queued reservation
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self.rate)
+            return wait
+
+    def try_enter(self) -> float | None:
+        """Take a concurrency slot if one is free (non-blocking, for asyncio).
+        Returns the send time to hand back to exit(), or None if full."""
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return time.monotonic()
+            return None
+
+    def enter(self) -> float:
+        """Wait for a token and a concurrency slot (blocking, for threads)."""
+        time.sleep(self.reserve())
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    # --- after a request ---
+    def exit(self, sent: float, status=None, retry_after: float | None = None, adapt: bool = True):
+        """
+        Release the slot taken at `sent` and adapt; status None = network error.
+        adapt=False only releases (a local error says nothing about the upstream).
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if adapt and (status in THROTTLE_STATUSES or status is None):
+                if retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+                if sent > self._last_decrease:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = now
+            elif adapt:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After."""
+        return max(retry_after or 0.0, random.uniform(0, self.backoff_factor * (2 ** attempt)))
+
+
+def retry_after_seconds(headers) -> float | None:
+    """Seconds from a Retry-After header (numeric form only)."""
+    try:
+        return max(0.0, float(headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+_shared = None
+
+
+def configure(**kwargs) -> Throttle:
+    """Install the process-wide throttle (called once by the CLI)."""
+    global _shared
+    _shared = Throttle(**kwargs)
+    return _shared
+
+
+def current() -> Throttle | None:
+    return _shared
@@ -1,22 +1,29 @@
 # week2/run_log_and_chart.py
+"""
+weather-daily: log today's weather, then redraw the chart -- in one process.
+Why: two child interpreters each paid startup, re-imported requests and
+matplotlib, and the chart re-read the rows the logger had just written.
+Now the fresh rows go straight from the log step to the chart cache.
+"""
 from pathlib import Path
-from dotenv import load_dotenv
-import subprocess, sys, os
+import os
+
+try:
+    from .log_weather_daily import log_daily, log_path
+    from .chart_weather import main as chart, out_path
+except ImportError:
+    from log_weather_daily import log_daily, log_path
+    from chart_weather import main as chart, out_path
+
 
 def main():
-    repo_root = Path(__file__).parents[1]
-    env_file = repo_root / "week2" / ".env"
-    if env_file.exists():
-        load_dotenv(env_file)
+    appended = log_daily()
+    chart(log_path, out_path, appended=appended)
 
-    py = sys.executable
-    log_script = repo_root / "week2" / "log_weather_daily.py"
-    chart_script = repo_root / "week2" / "chart_weather.py"
+    print(f"✓ Logged and chart generated → {out_path}")
+    if os.name == "nt" and os.getenv("OPEN_CHART") == "1" and Path(out_path).exists():
+        os.startfile(str(out_path))
 
-    subprocess.run([py, str(log_script)], check=True, cwd=repo_root)
-    subprocess.run([py, str(chart_script)], check=True, cwd=repo_root)
 
-    out_png = repo_root / "data" / "weather_chart.png"
-    print(f"✓ Logged and chart generated → {out_png}")
-    if os.name == "nt" and os.getenv("OPEN_CHART") == "1" and out_png.exists():
-        os.startfile(str(out_png))
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# week2/sidecar.py
+"""
+Shared plumbing for the SQLite files kept next to our data.
+Why: the log index, the history index, the response cache and the city index
+each carried their own copy of the same transaction wrapper, and the two CSV
+indexes their own copy of the same "catch up from a byte offset" loop.
+
+- immediate(db): BEGIN IMMEDIATE ... COMMIT, ROLLBACK on error. IMMEDIATE takes
+  the write lock up front, so two processes never both upgrade from read ->
+  write and deadlock. The connection must be in autocommit mode
+  (isolation_level=None).
+- An append-only CSV is followed by storing how many bytes of it are indexed
+  plus head_hash() of its header line: changed() says whether it was rewritten
+  or truncated since (start over), tail() reads only the rows after the offset.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+import csv, hashlib
+
+TAIL_BATCH = 10_000  # rows per batch handed back by tail()
+
+
+@contextmanager
+def immediate(db):
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+
+def head_hash(path: Path) -> str:
+    """Fingerprint of the header line; changes if the file was replaced."""
+    with Path(path).open("rb") as f:
+        return hashlib.sha1(f.readline()).hexdigest()
+
+
+def state(path: Path):
+    """(size, head_hash) of a CSV now; (0, "") if it is missing or empty."""
+    path = Path(path)
+    size = path.stat().st_size if path.exists() else 0
+    return size, head_hash(path) if size else ""
+
+
+def changed(size: int, head: str, offset: int, old_head: str) -> bool:
+    """Were bytes before `offset` rewritten or cut off since old_head was stored?"""
+    return size < offset or bool(offset and head != old_head)
+
+
+def tail(path: Path, offset: int, batch: int = TAIL_BATCH):
+    """
+    Yield ([row dict, ...], end) for the complete lines past `offset` (past the
+    header if offset is 0), at most `batch` rows at a time; `end` is the byte
+    offset they cover up to. A half-written last line is left for next time.
+    Always yields at least once, so the final `end` is known even with no rows.
+    """
+    with Path(path).open("rb") as f:
+        header = f.readline()
+        cols = next(csv.reader([header.decode("utf-8-sig")]), [])
+        pos = max(offset, len(header))
+        f.seek(pos)
+        rows = []
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # never index a half-written last line
+            pos += len(line)
+            rows.append(dict(zip(cols, next(csv.reader([line.decode("utf-8")]), []))))
+            if len(rows) >= batch:
+                yield rows, pos
+                rows = []
+        yield rows, pos
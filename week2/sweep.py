@@ -0,0 +1,152 @@
+# week2/sweep.py
+"""
+Sharded, resumable daily sweeps over big city lists.
+Why: the daily logger walked one hard-coded list in one process; ~50k
+locations need several workers (or machines), and a run that dies midway
+should pick up where it stopped instead of starting over.
+
+- Sharding: a city belongs to shard crc32(name) % N, so `--shard i/N` on N
+  workers splits any list the same way without coordination.
+- Checkpoint: each shard appends the inputs it has finished to
+  <sweep-dir>/<date>/shard-i-of-N.done, after their rows are on disk. A rerun
+  skips those; transient failures aren't marked, so they are retried.
+- Output: each shard writes its own CSV (same columns as the daily log, with
+  its own (date, city) index), so shards never contend for one file.
+- Merge: folds every shard CSV of the date into the daily log through
+  WeatherLog, whose (date, city) index drops duplicates -- safe to rerun,
+  and to run while shards are still going.
+"""
+from pathlib import Path
+import argparse, csv, os, zlib
+
+try:
+    from . import weather_cli
+    from .log_store import WeatherLog, log_row
+    from .pipeline import chunks
+except ImportError:
+    import weather_cli
+    from log_store import WeatherLog, log_row
+    from pipeline import chunks
+
+SWEEP_DIR = Path(__file__).parents[1] / "data" / "sweeps"
+CHECKPOINT_BATCH = 500   # rows appended + inputs checkpointed per write
+MERGE_BATCH = 5_000      # shard rows per locked append into the daily log
+FINAL_ERRORS = ("not found",)  # not retried on resume; everything else is
+
+
+def parse_shard(spec: str):
+    """'3/8' -> (3, 8); argparse type."""
+    try:
+        i, n = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N (e.g. 0/4), got {spec!r}")
+    if not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..{n - 1}, got {spec!r}")
+    return i, n
+
+
+def shard_of(city: str, n: int) -> int:
+    """Stable across processes and machines (unlike hash(), which is salted per run)."""
+    return zlib.crc32(" ".join(city.split()).lower().encode("utf-8")) % n
+
+
+def shard_paths(sweep_dir, date: str, i: int, n: int):
+    """(csv, checkpoint) for one shard of one day."""
+    base = Path(sweep_dir) / date / f"shard-{i}-of-{n}"
+    return base.with_suffix(".csv"), base.with_suffix(".done")
+
+
+class Checkpoint:
+    """Inputs one shard has finished: a text file, one city per line, appended per batch."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done = set()
+        if self.path.exists():
+            with self.path.open(encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.endswith("\n")}  # skip a torn last line
+
+    def mark(self, cities):
+        if not cities:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write("".join(f"{c}\n" for c in cities))
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(cities)
+
+
+def sweep(cities, shard=(0, 1), date=None, units="metric", sweep_dir=SWEEP_DIR, **fetch_kwargs) -> dict:
+    """
+    Fetch this shard's share of `cities` (read lazily) that isn't checkpointed
+    yet, appending rows to the shard CSV. fetch_kwargs go to
+    weather_cli.iter_weather (mode, max_workers, retries, ...).
+    Returns counts: logged, duplicate, resumed (done earlier), failed.
+    """
+    import datetime
+
+    i, n = shard
+    date = date or datetime.date.today().isoformat()
+    csv_path, done_path = shard_paths(sweep_dir, date, i, n)
+    checkpoint = Checkpoint(done_path)
+    stats = {"logged": 0, "duplicate": 0, "resumed": 0, "failed": 0}
+
+    def todo():
+        for city in cities:
+            if shard_of(city, n) != i:
+                continue
+            if city in checkpoint.done:
+                stats["resumed"] += 1
+                continue
+            yield city
+
+    rows, finished = [], []
+
+    def flush():
+        # rows first, then the checkpoint: a crash in between refetches a few
+        # cities whose rows the shard's own index then drops as duplicates
+        for written in log.append_many(rows):
+            stats["logged" if written else "duplicate"] += 1
+        checkpoint.mark(finished)
+        rows.clear()
+        finished.clear()
+
+    with WeatherLog(csv_path) as log:
+        try:
+            for _, city, payload in weather_cli.iter_weather(todo(), units, **fetch_kwargs):
+                if payload.get("ok"):
+                    rows.append(log_row(date, payload))
+                elif payload.get("error") not in FINAL_ERRORS:
+                    stats["failed"] += 1
+                    continue
+                finished.append(city)
+                if len(finished) >= CHECKPOINT_BATCH:
+                    flush()
+        finally:
+            flush()  # Ctrl+C keeps everything that already landed
+    return stats
+
+
+def _complete_lines(f):
+    """Lines up to the last newline: a shard still writing never yields a torn row."""
+    for line in f:
+        if not line.endswith("\n"):
+            return
+        yield line
+
+
+def merge(log_path, date=None, sweep_dir=SWEEP_DIR) -> dict:
+    """Fold every shard CSV for `date` into the daily log; (date, city) duplicates are dropped."""
+    import datetime
+
+    date = date or datetime.date.today().isoformat()
+    stats = {"shards": 0, "logged": 0, "duplicate": 0}
+    with WeatherLog(log_path) as log:
+        for shard_csv in sorted((Path(sweep_dir) / date).glob("shard-*.csv")):
+            stats["shards"] += 1
+            with shard_csv.open(newline="", encoding="utf-8") as f:
+                for block in chunks(csv.DictReader(_complete_lines(f)), MERGE_BATCH):
+                    for written in log.append_many(block):
+                        stats["logged" if written else "duplicate"] += 1
+    return stats
@@ -1,39 +1,84 @@
 # week2/weather_cli.py
+from __future__ import annotations
 from pathlib import Path
-from dotenv import load_dotenv
-import os, argparse, logging, json, csv, datetime
-from logging.handlers import RotatingFileHandler
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-
-
-# IMPORTANT: support both package usage ("weather" command) and direct script run
+import os, sys, argparse, json, datetime, threading, time
+from collections import OrderedDict, deque
+from itertools import chain, islice
+from typing import TYPE_CHECKING
+
+# IMPORTANT: support both package usage ("weather" command) and direct script run.
+# Only light modules load here: requests, dotenv, the sqlite-backed stores,
+# thread pools and log handlers are imported by the code paths that use them,
+# so `weather --version` / `--help` stay fast and importing has no side effects.
 try:
-    from .http_utils import make_session  # when installed as a package
+    from .pipeline import chunks, done, pump  # when installed as a package
+    from . import hedge, metrics, rate_limit
+    from .payload import CANONICAL_UNITS, Payload
 except ImportError:
-    from http_utils import make_session   # when running: python week2/weather_cli.py
+    from pipeline import chunks, done, pump   # when running: python week2/weather_cli.py
+    import hedge, metrics, rate_limit
+    from payload import CANONICAL_UNITS, Payload
+
+if TYPE_CHECKING:  # annotations only; requests itself loads on first fetch
+    import requests
 
 VERSION = "0.1.0"
 
 
-# --- config & env ---
-load_dotenv(Path(__file__).with_name(".env"))
-KEY = os.getenv("OPENWEATHER_API_KEY") or exit("Missing OPENWEATHER_API_KEY in week2/.env")
-BASE = "https://api.openweathermap.org/data/2.5/weather"
+# --- config & env (read on first use, not at import) ---
+DEFAULT_API_ROOT = "https://api.openweathermap.org/data/2.5"
+_env_loaded = False
+_settings = None
+
+def load_env():
+    """week2/.env -> os.environ, once (variables already set win)."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv(Path(__file__).with_name(".env"))
+        _env_loaded = True
+
+def settings() -> dict:
+    """API key + endpoints, resolved on first use; exits if the key is missing."""
+    global _settings
+    if _settings is None:
+        load_env()
+        key = os.getenv("OPENWEATHER_API_KEY") or exit("Missing OPENWEATHER_API_KEY in week2/.env")
+        root = os.getenv("OPENWEATHER_URL", DEFAULT_API_ROOT)  # override for a local stand-in
+        _settings = {"KEY": key, "API_ROOT": root, "BASE": f"{root}/weather"}
+    return _settings
+
+def __getattr__(name):
+    """weather_cli.KEY / API_ROOT / BASE still work; they resolve lazily."""
+    if name in ("KEY", "API_ROOT", "BASE"):
+        return settings()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 TIMEOUT = 10
+THREAD_WORKERS = 8   # auto cap for the thread pool (one OS thread per in-flight city)
+ASYNC_WORKERS = 64   # auto cap for the asyncio engine (one socket per in-flight city)
 
 # --- helpers ---
 def unit_label(units: str) -> str:
     return {"metric": "°C", "imperial": "°F", "standard": "K"}.get(units, "")
 
-def parse_args():
+def _hedge_spec(spec: str) -> str:
+    try:
+        hedge.parse_spec(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return spec
+
+def parse_args(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not {"-h", "--help", "--version"} & set(argv):
+        load_env()  # .env may set the defaults below (UNITS, TIMEOUT, ...)
     p = argparse.ArgumentParser(description="Weather CLI")
     p.add_argument("cities", nargs="*", help='City names (e.g., Seattle "New York")')
     p.add_argument("--units", choices=["metric","imperial","standard"],
                    default=os.getenv("UNITS","metric"),
-                   help="Units: metric(°C), imperial(°F), standard(K).")
+                   help="Units: metric(°C), imperial(°F), standard(K). Converted locally: "
+                        "every unit shares one fetch and one cache entry per city.")
     p.add_argument("--timeout", type=int, default=int(os.getenv("TIMEOUT","10")),
                    help="Per-request timeout in seconds (default 10 or TIMEOUT env).")
     p.add_argument("--retries", type=int, default=int(os.getenv("RETRIES","3")),
@@ -47,102 +92,575 @@ def parse_args():
     # add/replace your csv-out arg
     p.add_argument("--csv-out", type=str, default=os.getenv("CSV_OUT"),
                help="Append this run to a CSV (default from CSV_OUT env if set)")
-    p.add_argument("--version", action="version", version="weather-cli 0.1.0")
+    p.add_argument("--stream", action="store_true",
+               help="Print (and log/CSV-append) each city as soon as it completes, in completion order.")
+    p.add_argument("--ordered", action="store_true",
+               help="Stream in input order: each line prints as soon as all earlier cities are done.")
+    p.add_argument("--version", action="version", version=f"weather-cli {VERSION}")
     p.add_argument("--max-workers", type=int, default=int(os.getenv("MAX_WORKERS", "0")),
                help="Max parallel requests (0=auto).")
-    p.add_argument("--cache-day", action="store_true",
-               help="Cache successful responses for the current day (per units) and reuse them.")
-    return p.parse_args()
+    p.add_argument("--mode", choices=["auto", "sequential", "thread", "async", "group"],
+               default=os.getenv("FETCH_MODE", "auto"),
+               help="Fetch engine: thread pool, asyncio (needs aiohttp), /group batches of 20 "
+                    "known city IDs, or sequential (default auto).")
+    p.add_argument("--cache", "--cache-day", dest="cache", action="store_true",
+               help="Reuse cached responses (SQLite, data/cache/) while they are fresh.")
+    p.add_argument("--cache-ttl", type=float, default=float(os.getenv("CACHE_TTL", "600")),
+               help="Seconds a cached response stays fresh (default 600 or CACHE_TTL env).")
+    p.add_argument("--cache-max", type=int, default=int(os.getenv("CACHE_MAX", "20000")),
+               help="Max cached responses kept; least recently used are evicted (default 20000).")
+    p.add_argument("--cache-stale", type=float, default=float(os.getenv("CACHE_STALE", "0")),
+               help="Seconds past --cache-ttl an answer is still served at once while it is refreshed "
+                    "in the background (default 0 or CACHE_STALE env).")
+    p.add_argument("--rpm", type=float, default=float(os.getenv("RATE_LIMIT", "0")),
+               help="Max requests per minute across all workers (default 0=unlimited or RATE_LIMIT env).")
+    p.add_argument("--burst", type=int, default=int(os.getenv("RATE_BURST", "0")),
+               help="Requests allowed back to back under --rpm (default 0=one second's worth).")
+    p.add_argument("--hedge", nargs="?", const="p95", default=os.getenv("HEDGE"), type=_hedge_spec,
+               help="Re-send a request still unanswered after this delay (pNN of this run's fetch times, "
+                    "or seconds); the first answer wins. Bare --hedge = p95 (default off or HEDGE env).")
+    p.add_argument("--hedge-budget", type=float, default=float(os.getenv("HEDGE_BUDGET", "0.05")),
+               help="Max hedged requests as a fraction of requests (default 0.05 = 5%%).")
+    p.add_argument("--no-daemon", action="store_true",
+               help="Fetch in-process even if a `weather serve` daemon is running (or WEATHER_DAEMON=off).")
+    p.add_argument("--metrics", nargs="?", const="-", default=os.getenv("METRICS_OUT"),
+               help="Print a JSON run summary (timings, retries, cache hits) after the results, "
+                    "or write it to this file.")
+    p.add_argument("--metrics-prom", default=os.getenv("METRICS_TEXTFILE"),
+               help="Also write the summary as a Prometheus textfile (for node_exporter).")
+    return p.parse_args(argv)
+
+def _url(city, units: str) -> str:
+    """city is a name (q=...) or, once resolved by the city index, an int ID (id=...)."""
+    where = f"id={city}" if isinstance(city, int) else f"q={city}"
+    cfg = settings()
+    return f"{cfg['BASE']}?{where}&appid={cfg['KEY']}&units={units}"
+
+def normalize_response(city: str, units: str, status: int, load_json) -> Payload:
+    """Map an HTTP status + lazy JSON loader to a normalized Payload.
+    Shared by the requests-based paths and the asyncio engine so every mode
+    returns the exact same shape. Only the fields we keep outlive the parse."""
+    if status == 200:
+        try:
+            return Payload.from_current(load_json(), city, units)
+        except Exception:
+            return Payload.failed(city, units, "bad json")
+    if status == 404:
+        return Payload.failed(city, units, "not found")
+    if status == 401:
+        return Payload.failed(city, units, "auth")
+    if status in (429, 500, 502, 503, 504):
+        return Payload.failed(city, units, f"server {status}")
+    return Payload.failed(city, units, f"status {status}")
+
+def fetch_raw(city: str, units: str, session: requests.Session, timeout: int, cache=None) -> Payload:
+    """
+    Return a normalized Payload with either data or an error (no printing here).
+    With a ResponseCache: an expired entry's ETag / Last-Modified go along, a
+    304 returns the stored payload (no body to parse, no row to rewrite), and
+    successes are written back.
+    """
+    import requests
 
-def fetch_raw(city: str, units: str, session: requests.Session, timeout: int) -> dict:
-    """Return a normalized dict with either data or an error (no printing here)."""
-    url = f"{BASE}?q={city}&appid={KEY}&units={units}"
+    key = _cache_key()(city, units) if cache is not None else None
+    headers = cache.conditional_headers(key) if key else {}
+    with metrics.timed("weather_fetch_seconds"):
+        try:
+            r = session.get(_url(city, units), timeout=timeout, headers=headers or None)
+            if r.status_code == 304:
+                payload = cache.not_modified(key) if key else None
+                if payload is not None:
+                    metrics.inc("weather_cache_revalidated_total")
+                    return Payload.from_dict(payload)
+                r = session.get(_url(city, units), timeout=timeout)  # stored copy gone: ask in full
+        except requests.exceptions.RequestException as e:
+            return Payload.failed(city, units, f"network: {e}")
+        # straight from the bytes: no charset sniffing / str copy as in r.json()
+        payload = normalize_response(city, units, r.status_code, lambda: json.loads(r.content))
+    _remember(cache, city, units, payload, r.headers)
+    return payload
+
+def _auto_workers(n: int, mode: str = "thread") -> int:
+    """Default concurrency when --max-workers is 0 (threads are pricier than sockets)."""
+    cap = ASYNC_WORKERS if mode == "async" else THREAD_WORKERS
+    return min(max(1, n), cap)
+
+LOOKUP_CHUNK = 500  # inputs per cache / city-index round trip
+CSV_BATCH = 500     # CSV rows per locked append when not streaming
+
+def _cache_key():
     try:
-        r = session.get(url, timeout=timeout)
-    except requests.exceptions.RequestException as e:
-        return {"ok": False, "city": city, "units": units, "error": f"network: {e}"}
+        from .cache_store import cache_key
+    except ImportError:
+        from cache_store import cache_key
+    return cache_key
 
-    if r.status_code == 200:
-        try:
-            d = r.json()
-            return {
-                "ok": True,
-                "city": d.get("name", city),
-                "units": units,
-                "temp": d["main"]["temp"],
-                "feels_like": d["main"]["feels_like"],
-                "humidity": d["main"]["humidity"],
-                "conditions": (d["weather"][0]["description"] if d.get("weather") else None),
-            }
-        except Exception:
-            return {"ok": False, "city": city, "units": units, "error": "bad json"}
-    if r.status_code == 404:
-        return {"ok": False, "city": city, "units": units, "error": "not found"}
-    if r.status_code == 401:
-        return {"ok": False, "city": city, "units": units, "error": "auth"}
-    if r.status_code in (429, 500, 502, 503, 504):
-        return {"ok": False, "city": city, "units": units, "error": f"server {r.status_code}"}
-    return {"ok": False, "city": city, "units": units, "error": f"status {r.status_code}"}
+def _lookup(cities, units, cache, timeout=TIMEOUT, retries=3, backoff=0.5):
+    """
+    (idx, city, cached payload or None) per input; reads input and cache in
+    chunks. Stale entries are served too, and refreshed in the background
+    (with the run's timeout / retries / backoff).
+    """
+    for block in chunks(enumerate(cities), LOOKUP_CHUNK):
+        found = {}
+        if cache:
+            cache_key = _cache_key()
+            with metrics.timed("weather_cache_lookup_seconds"):
+                found = cache.lookup_many(cache_key(c, units) for _, c in block)
+            metrics.inc("weather_cache_hits_total", len(found))
+            metrics.inc("weather_cache_misses_total", len(block) - len(found))
+        for idx, city in block:
+            payload, state = found.get(cache_key(city, units), (None, None)) if found else (None, None)
+            if state == "stale":
+                metrics.inc("weather_cache_stale_total")
+                _refresh_later(city, units, cache, timeout, retries, backoff)
+            yield idx, city, payload if payload is None else Payload.from_dict(payload)
+
+def _remember(cache, city, units, payload, headers=None):
+    if cache is not None and payload.get("ok"):
+        cache_key = _cache_key()
+        # the upstream's validators, for a conditional request once this expires
+        seen = (headers.get("ETag"), headers.get("Last-Modified")) if headers is not None else (None, None)
+        items = [(cache_key(city, units), payload, seen)]
+        if isinstance(payload.get("id"), int) and payload["id"] != city:
+            # also under its ID: once the city index knows the name, the next run asks by ID
+            items.append((cache_key(payload["id"], units), payload, seen))
+        with metrics.timed("weather_cache_write_seconds"):
+            cache.set_many(items)
+
+REFRESH_WORKERS = 4  # background threads refreshing stale cache entries
+_refresher = None    # (executor, {cache key: future}) once the first stale entry is served
+_refresh_lock = threading.Lock()
+_refresh_local = threading.local()
+
+def _refresh_later(city, units, cache, timeout, retries, backoff):
+    """Stale-while-revalidate: refresh a served-stale entry off the caller's path, once per key."""
+    global _refresher
+    from concurrent.futures import ThreadPoolExecutor
+
+    key = _cache_key()(city, units)
+    with _refresh_lock:
+        if _refresher is None:
+            _refresher = (ThreadPoolExecutor(REFRESH_WORKERS, thread_name_prefix="refresh"), {})
+        pool, pending = _refresher
+        if key not in pending:
+            pending[key] = pool.submit(_refresh_one, city, units, cache, timeout, retries, backoff)
+            metrics.inc("weather_cache_refreshes_total")
+
+def _refresh_one(city, units, cache, timeout, retries, backoff):
+    held = getattr(_refresh_local, "session", None)
+    if held is None or held[0] != (retries, backoff):  # one per refresh thread, reused across refreshes
+        held = _refresh_local.session = ((retries, backoff), _new_session(retries, backoff))
+    return fetch_raw(city, units, held[1], timeout, cache)
+
+def drain_refreshes():
+    """Wait for background refreshes (before the cache they write to is closed)."""
+    global _refresher
+    with _refresh_lock:
+        refresher, _refresher = _refresher, None
+    if refresher is not None:
+        refresher[0].shutdown(wait=True)
+
+def _thread_sessions(retries: int, backoff: float):
+    """session() -> the calling thread's session, made on first use and reused after
+    (requests.Session isn't thread-safe; one per worker keeps its connections open)."""
+    local = threading.local()
+
+    def session():
+        s = getattr(local, "session", None)
+        if s is None:
+            s = local.session = _new_session(retries, backoff)
+        return s
+    return session
+
+def _queued(fn, *args):
+    """fn(*args) for a thread pool, recording how long it sat in the pool's queue."""
+    queued = time.perf_counter()
+
+    def run():
+        metrics.observe("weather_queue_wait_seconds", time.perf_counter() - queued)
+        return fn(*args)
+    return run
+
+def _collect(n, items):
+    """[(input_city, payload)] in input order from (idx, city, payload) items."""
+    results = [None] * n
+    for idx, city, payload in items:
+        results[idx] = (city, payload)
+    return results
+
+# Every engine comes in two flavors: iter_* takes any iterable of cities (read
+# lazily, at most a bounded window ahead) and yields (idx, city, payload) as
+# each answer lands; fetch_* takes a list and returns the input-ordered list.
 
-def fetch_parallel(cities, units, retries, backoff, timeout, use_cache=False):
+def iter_sequential(cities, units, session, timeout, cache=None, retries=3, backoff=0.5):
+    """One city at a time on a single session (the --max-workers 1 path)."""
+    for idx, city, hit in _lookup(cities, units, cache, timeout, retries, backoff):
+        if hit is None:
+            hit = fetch_raw(city, units, session, timeout, cache)
+        yield idx, city, hit
+
+def iter_parallel(cities, units, retries, backoff, timeout, cache=None, max_workers=0):
     """
-    Return list of (input_city, payload) preserving input order.
-    Caches by lowercased input city for today's date+units.
+    Thread pool; yields in completion order.
+    With a ResponseCache, fresh entries are served from it and new successes
+    are written back one row at a time (visible to other processes at once).
     """
-    results = [None] * len(cities)
-
-    # load cache (if any)
-    cache = {}
-    cpath = None
-    if use_cache:
-        cpath = _cache_path(units)
-        if cpath.exists():
-            try:
-                cache = json.loads(cpath.read_text(encoding="utf-8"))
-            except Exception:
-                cache = {}
+    from concurrent.futures import ThreadPoolExecutor
+
+    max_workers = max_workers or THREAD_WORKERS
+    session = _thread_sessions(retries, backoff)
 
     # worker
-    def work(idx_city):
-        idx, city = idx_city
-        key = city.strip().lower()
-        if use_cache and key in cache:
-            return (idx, city, cache[key])
-
-        session = _new_session(retries, backoff)  # 1 session per task (requests.Session isn’t thread-safe)
-        payload = fetch_raw(city, units, session, timeout)
-        if use_cache and payload.get("ok"):
-            cache[key] = payload
-        return (idx, city, payload)
+    def work(idx, city):
+        # the running thread's session (a hedge runs on another thread, so it has its own)
+        fetch = lambda: fetch_raw(city, units, session(), timeout, cache)
+        hedger = hedge.current()
+        return hedger.call(fetch) if hedger else fetch()
 
     # run
-    max_workers = min(max(1, len(cities)), 8)  # default cap; you can tune
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        for idx, city, payload in ex.map(work, enumerate(cities)):
-            results[idx] = (city, payload)
+        def submit(item):
+            idx, city, hit = item
+            return done(hit) if hit is not None else ex.submit(_queued(work, idx, city))
+
+        looked_up = _lookup(cities, units, cache, timeout, retries, backoff)
+        for (idx, city, _), payload in pump(looked_up, submit, 2 * max_workers):
+            yield idx, city, payload
+
+def iter_async(cities, units, retries, backoff, timeout, cache=None, max_workers=0):
+    """
+    Same as iter_parallel, but runs on one asyncio loop with a single
+    keep-alive connection pool. --max-workers bounds open sockets, not threads.
+    """
+    try:
+        from .async_fetch import AsyncClient
+    except ImportError:
+        from async_fetch import AsyncClient
+
+    max_workers = max_workers or ASYNC_WORKERS
+    with AsyncClient(max_workers, timeout=timeout, retries=retries, backoff=backoff,
+                     throttle=rate_limit.current()) as client:
+        cache_key = _cache_key()
+
+        def submit(item):
+            idx, city, hit = item
+            # only hit the network for cache misses (conditionally, if an expired entry has validators)
+            if hit is not None:
+                return done(hit)
+            headers = cache.conditional_headers(cache_key(city, units)) if cache else None
+            return client.submit(_url(city, units), headers)
+
+        looked_up = _lookup(cities, units, cache, timeout, retries, backoff)
+        for (idx, city, hit), answer in pump(looked_up, submit, 2 * max_workers):
+            if hit is not None:
+                yield idx, city, hit
+                continue
+            status, body, err, seen = answer
+            if status == 304:
+                payload = cache.not_modified(cache_key(city, units)) if cache else None
+                if payload is not None:
+                    metrics.inc("weather_cache_revalidated_total")
+                    yield idx, city, Payload.from_dict(payload)
+                    continue
+                # stored copy gone: ask in full
+                status, body, err, seen = client.submit(_url(city, units)).result()
+            if err is not None:
+                payload = Payload.failed(city, units, f"network: {err}")
+            else:
+                payload = normalize_response(city, units, status, lambda b=body: json.loads(b))
+            _remember(cache, city, units, payload, {"ETag": seen[0], "Last-Modified": seen[1]})
+            yield idx, city, payload
+
+def iter_grouped(cities, units, retries, backoff, timeout, cache=None, max_workers=0):
+    """
+    Int city IDs (iter_unique resolves known names to theirs) are fetched 20 at
+    a time through /group; each batch is yielded as it lands. Names (and IDs
+    the group call did not return) fall back to one /weather call each;
+    iter_unique teaches the city index their IDs for next time.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import requests
+    try:
+        from .group_fetch import GROUP_SIZE, group_url, split_group
+    except ImportError:
+        from group_fetch import GROUP_SIZE, group_url, split_group
 
-    # write cache back if changed
-    if use_cache and cpath:
+    max_workers = max_workers or THREAD_WORKERS
+    session = _thread_sessions(retries, backoff)
+
+    def one(idx, city):
+        fetch = lambda: fetch_raw(city, units, session(), timeout, cache)
+        hedger = hedge.current()
+        return idx, city, hedger.call(fetch) if hedger else fetch()
+
+    def group_work(members):
+        """members: {city_id: [(idx, city)]} -> [(idx, city, payload)]"""
+        status, data = None, None
         try:
-            cpath.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
+            cfg = settings()
+            r = session().get(group_url(cfg["API_ROOT"], list(members), units, cfg["KEY"]), timeout=timeout)
+            status = r.status_code
+            data = split_group(r.content) if status == 200 else None
+        except requests.exceptions.RequestException as e:
+            data = f"network: {e}"
         except Exception:
-            pass
+            data = "bad json"
+        out = []
+        for cid, waiting in members.items():
+            for idx, city in waiting:
+                if isinstance(data, dict) and cid in data:
+                    payload = normalize_response(city, units, 200, lambda item=data[cid]: item)
+                elif isinstance(data, dict):
+                    out.append(one(idx, city))  # missing from its group
+                    continue
+                elif isinstance(data, str):
+                    payload = Payload.failed(city, units, data)
+                else:
+                    payload = normalize_response(city, units, status, None)
+                _remember(cache, city, units, payload)
+                out.append((idx, city, payload))
+        return out
+
+    def tasks():
+        """Cache hits, single lookups and full groups of 20 IDs, in input order."""
+        members = {}
+        for idx, city, hit in _lookup(cities, units, cache, timeout, retries, backoff):
+            if hit is not None:
+                yield "hit", [(idx, city, hit)]
+            elif not isinstance(city, int):
+                yield "one", (idx, city)
+            else:
+                members.setdefault(city, []).append((idx, city))
+                if len(members) == GROUP_SIZE:
+                    yield "group", members
+                    members = {}
+        if members:
+            yield "group", members
 
-    return results
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        def submit(task):
+            kind, arg = task
+            if kind == "hit":
+                return done(arg)
+            if kind == "one":
+                return ex.submit(_queued(lambda: [one(*arg)]))
+            return ex.submit(_queued(group_work, arg))
+
+        for _, answers in pump(tasks(), submit, 2 * max_workers):
+            yield from answers
+
+def iter_daemon(cities, units, client, fallback=None, max_age=None):
+    """
+    Hand the cities to a running `weather serve` daemon, LOOKUP_CHUNK per call;
+    it answers from its hot cache only if no older than max_age seconds.
+    If it goes away mid-run, the rest go through fallback(cities) in-process.
+    """
+    it = iter(cities)
+    base = 0
+    for block in chunks(it, LOOKUP_CHUNK):
+        try:
+            payloads = client.fetch(block, units, max_age)
+        except OSError:
+            if fallback is None:
+                raise
+            metrics.inc("weather_daemon_fallbacks_total")
+            for idx, city, payload in fallback(chain(block, it)):
+                yield base + idx, city, payload
+            return
+        for i, (city, payload) in enumerate(zip(block, payloads)):
+            yield base + i, city, payload
+        base += len(block)
+
+def fetch_sequential(cities, units, session, timeout, cache=None):
+    return _collect(len(cities), iter_sequential(cities, units, session, timeout, cache))
+
+def fetch_parallel(cities, units, retries, backoff, timeout, cache=None, max_workers=0):
+    """Return list of (input_city, payload) preserving input order."""
+    return _collect(len(cities), iter_parallel(cities, units, retries, backoff, timeout, cache, max_workers))
+
+def fetch_async(cities, units, retries, backoff, timeout, cache=None, max_workers=0):
+    return _collect(len(cities), iter_async(cities, units, retries, backoff, timeout, cache, max_workers))
+
+def fetch_grouped(cities, units, retries, backoff, timeout, cache=None, max_workers=0):
+    return _collect(len(cities), iter_grouped(cities, units, retries, backoff, timeout, cache, max_workers))
+
+LEARN_BATCH = 500     # city-index rows written per transaction while streaming
+RECENT_MAX = 10_000   # finished locations remembered per run (repeats reuse the answer)
+PARKED_MAX = 10_000   # duplicate inputs held back waiting on an in-flight location
+REORDER_MAX = 10_000  # finished results held back for input order behind a slow city
+
+def iter_unique(fetch, cities, index):
+    """
+    Collapse aliases and duplicates so each location is requested once: run
+    fetch(queries) -> iterator of (query_idx, query, payload) over a lazily
+    built query stream and yield (input_idx, input_city, payload) for every
+    input as its location lands. Duplicates of an in-flight location wait on
+    it; repeats of a recently finished one reuse its answer. Both buffers are
+    bounded, so memory stays flat however long `cities` is (past the bounds,
+    a repeat is simply queried again). Known places are queried by ID; every
+    answer teaches the index which ID its name belongs to.
+    """
+    in_flight = {}         # location -> query idx currently fetching it
+    riders = {}            # query idx -> (location, [(idx, city)] waiting on it)
+    recent = OrderedDict() # location -> payload, most recent last
+    ready = deque()        # (idx, city, payload) answered without a request
+    parked = 0             # inputs held in `ready` or behind another input's query
+
+    def queries():
+        nonlocal parked
+        qi = 0
+        for block in chunks(enumerate(cities), LOOKUP_CHUNK):
+            locs = index.resolve([city for _, city in block])
+            for (idx, city), loc in zip(block, locs):
+                if parked < PARKED_MAX:
+                    if loc in recent:
+                        ready.append((idx, city, recent[loc]))
+                        parked += 1
+                        continue
+                    if loc in in_flight:
+                        riders[in_flight[loc]][1].append((idx, city))
+                        parked += 1
+                        continue
+                in_flight[loc] = qi
+                riders[qi] = (loc, [(idx, city)])
+                qi += 1
+                yield loc if isinstance(loc, int) else city.strip()
+
+    def answer(idx, city, payload):
+        if not payload.ok:
+            payload = payload.replace(city=city)  # errors read better with the input spelling
+        return idx, city, payload
+
+    learned = []
+    try:
+        for qi, query, payload in fetch(queries()):
+            while ready:
+                parked -= 1
+                yield answer(*ready.popleft())
+            loc, inputs = riders.pop(qi)
+            if in_flight.get(loc) == qi:
+                del in_flight[loc]
+            parked -= len(inputs) - 1
+            recent[loc] = payload
+            recent.move_to_end(loc)
+            if len(recent) > RECENT_MAX:
+                recent.popitem(last=False)
+            learned.append((query, payload))
+            if len(learned) >= LEARN_BATCH:
+                index.learn(learned)
+                learned.clear()
+            for idx, city in inputs:
+                yield answer(idx, city, payload)
+        while ready:
+            parked -= 1
+            yield answer(*ready.popleft())
+    finally:
+        index.learn(learned)
+
+def fetch_unique(fetch, cities, index):
+    """iter_unique, collected as [(input_city, payload)] in input order."""
+    return _collect(len(cities), iter_unique(fetch, cities, index))
+
+def _resolve_mode(mode: str, n: int, max_workers: int = 0):
+    """(engine, workers) for n peeked inputs: "auto" is threads, or sequential for one city."""
+    max_workers = max_workers or _auto_workers(n, mode)
+    if mode == "auto":
+        mode = "thread" if max_workers > 1 else "sequential"
+    return mode, max_workers
+
+def _engine(mode, units, retries, backoff, timeout, cache=None, max_workers=0):
+    """fetch(queries) for iter_unique: async, /group batches, thread pool or sequential."""
+    if mode == "async":
+        return lambda queries: iter_async(queries, units, retries, backoff, timeout, cache, max_workers)
+    if mode == "group":
+        return lambda queries: iter_grouped(queries, units, retries, backoff, timeout, cache, max_workers)
+    if mode == "thread":
+        return lambda queries: iter_parallel(queries, units, retries, backoff, timeout, cache, max_workers)
+    return lambda queries: iter_sequential(queries, units, _new_session(retries, backoff), timeout, cache,
+                                           retries, backoff)
+
+def iter_weather(cities, units: str, mode: str = "auto", retries: int = 3, backoff: float = 0.5,
+                 timeout: int = TIMEOUT, cache=None, max_workers: int = 0):
+    """
+    The CLI's fetch path as a library call (the daily logger and sweeps use
+    it): each unique location fetched once over pooled sessions, in parallel,
+    through the shared throttle. `cities` is read lazily; yields
+    (idx, input_city, payload) as each answer lands, converted to `units`
+    (the fetch and the cache always use CANONICAL_UNITS).
+    """
+    try:
+        from .city_index import CityIndex
+    except ImportError:
+        from city_index import CityIndex
+
+    settings()  # loads week2/.env; exits if the key is missing
+    cities = iter(cities)
+    head = list(islice(cities, ASYNC_WORKERS))  # enough to size the pool
+    mode, max_workers = _resolve_mode(mode, len(head), max_workers)
+    if rate_limit.current() is None:  # same env knobs as --rpm / --burst
+        rate_limit.configure(rpm=float(os.getenv("RATE_LIMIT", "0")), burst=int(os.getenv("RATE_BURST", "0")),
+                             max_concurrency=max_workers, backoff=backoff)
+    fetch = _engine(mode, CANONICAL_UNITS, retries, backoff, timeout, cache, max_workers)
+    index = CityIndex()
+    try:
+        for idx, city, payload in iter_unique(fetch, chain(head, cities), index):
+            yield idx, city, payload.to_units(units)
+    finally:
+        index.close()
+
+def fetch_weather(cities, units: str, **kwargs):
+    """iter_weather, collected as [(input_city, payload)] in input order."""
+    cities = list(cities)
+    return _collect(len(cities), iter_weather(cities, units, **kwargs))
+
+def iter_cities(cities=(), cities_file=None):
+    """Positional cities, then non-blank lines of cities_file, read lazily."""
+    yield from cities
+    if cities_file:
+        with open(Path(cities_file), "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+
+def format_line(city_input, payload: Payload, units: str) -> str:
+    """Human-readable line for one payload (the non --json output)."""
+    if payload.get("ok"):
+        return f"{payload['city']}: {payload['temp']:.2f}{unit_label(units)}, Humidity {payload['humidity']}%"
+    err = payload.get("error", "unknown")
+    city = payload.get("city", city_input)
+    if err == "not found":
+        return f"{city}: not found (check spelling)"
+    if err == "auth":
+        return "Auth error: check OPENWEATHER_API_KEY in week2/.env"
+    if err.startswith("server"):
+        code = err.split()[-1]
+        return f"Temporary server issue ({code}). Please try again."
+    if err.startswith("network"):
+        return f"Network error for {city}: {err.split(':',1)[-1].strip()}"
+    return f"Error: {err}"
 
 def setup_logging():
-    log_dir = Path(__file__).parents[1] / "logs"
-    log_dir.mkdir(parents=True, exist_ok=True)
-    handler = RotatingFileHandler(log_dir / "weather-cli.log",
-                                  maxBytes=200_000, backupCount=2, encoding="utf-8")
-    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    """The run log (logs/weather-cli.log, or under LOG_DIR); safe to call once per main() in one process."""
+    import logging
+    from logging.handlers import RotatingFileHandler
+
+    log_dir = Path(os.getenv("LOG_DIR") or Path(__file__).parents[1] / "logs")
+    path = os.path.abspath(log_dir / "weather-cli.log")
     logger = logging.getLogger("weather_cli")
     logger.setLevel(logging.INFO)
+    if any(getattr(h, "baseFilename", None) == path for h in logger.handlers):
+        return logger  # already attached by an earlier run in this process
+    log_dir.mkdir(parents=True, exist_ok=True)
+    handler = RotatingFileHandler(path, maxBytes=200_000, backupCount=2, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
     logger.addHandler(handler)
     return logger
 
 def fetch_and_format(city: str, units: str, session: requests.Session, timeout: int) -> str:
-    url = f"{BASE}?q={city}&appid={KEY}&units={units}"
+    import requests
+
+    url = _url(city, units)
     try:
         r = session.get(url, timeout=timeout)
     except requests.exceptions.RequestException as e:
@@ -168,22 +686,20 @@ def fetch_and_format(city: str, units: str, session: requests.Session, timeout:
 def _new_session(retries: int, backoff: float) -> requests.Session:
     """Create a session; supports both param and no-param make_session()."""
     try:
-        return make_session(total=retries, backoff=backoff)  # your newer util
-    except TypeError:
-        return make_session()  # fallback if util has no args
-
-def _cache_path(units: str) -> Path:
-    """data/cache/YYYY-MM-DD_units.json"""
-    root = Path(__file__).parents[1]
-    cdir = root / "data" / "cache"
-    cdir.mkdir(parents=True, exist_ok=True)
-    today = datetime.date.today().isoformat()
-    return cdir / f"{today}_{units}.json"
-
+        from .http_utils import make_session
+    except ImportError:
+        from http_utils import make_session
+    with metrics.timed("weather_session_create_seconds"):
+        try:
+            return make_session(total=retries, backoff=backoff, throttle=rate_limit.current())  # your newer util
+        except TypeError:
+            return make_session()  # fallback if util has no args
 
 def get_weather(city: str) -> str:
     """Fetch weather for one city with retries, timeouts, and friendly errors."""
-    url = f"{BASE}?q={city}&appid={KEY}&units={UNITS}"
+    import requests
+
+    url = _url(city, UNITS)
     try:
         r = SESSION.get(url, timeout=TIMEOUT)  # <-- NEW: use the session
     except requests.exceptions.RequestException as e:
@@ -209,107 +725,176 @@ def get_weather(city: str) -> str:
     return f"Error {r.status_code}: {r.text[:140]}"
 
 
+def _export_metrics(args, started, n):
+    """--metrics (JSON to stdout or a file) and --metrics-prom (node_exporter textfile)."""
+    metrics.set_gauge("weather_run_seconds", round(time.perf_counter() - started, 6))
+    metrics.set_gauge("weather_run_cities", n)
+    metrics.set_gauge("weather_run_last_timestamp_seconds", round(time.time(), 3))
+    if args.metrics == "-":
+        print(json.dumps({"metrics": metrics.REGISTRY.summary()}, indent=None if args.json else 2))
+    elif args.metrics:
+        Path(args.metrics).write_text(json.dumps(metrics.REGISTRY.summary(), indent=2) + "\n", encoding="utf-8")
+    if args.metrics_prom:
+        metrics.REGISTRY.write_textfile(args.metrics_prom)
+
+def _daemon_client(args, logger):
+    """
+    A client for a running `weather serve`, or None (the usual case: fetch here).
+    Also None when this run asks for fetching the daemon doesn't do: its own
+    --mode or --hedge, or --timeout/--retries/--backoff/--rpm other than the daemon's.
+    """
+    try:
+        from .daemon import connect
+    except ImportError:
+        from daemon import connect
+    if args.mode != "auto" or args.hedge:
+        logger.info("not using a daemon: --mode %s --hedge %s are fetched in-process", args.mode, args.hedge)
+        return None
+    client = connect(timeout=args.timeout * (args.retries + 1) + 30)
+    if client is None:
+        return None
+    wanted = {"timeout": args.timeout, "retries": args.retries, "backoff": args.backoff, "rpm": args.rpm}
+    differs = {k: v for k, v in wanted.items() if client.settings.get(k) != v}
+    if differs:
+        logger.info("not using daemon at %s: it fetches with %s, this run asked for %s", client.url,
+                    {k: client.settings.get(k) for k in differs}, differs)
+        return None
+    return client
+
 def main():
+    if sys.argv[1:2] == ["serve"]:  # `weather serve [...]`: run the daemon instead
+        try:
+            from .daemon import main as serve
+        except ImportError:
+            from daemon import main as serve
+        return serve(sys.argv[2:])
+    if sys.argv[1:2] == ["history"]:  # `weather history [...]`: query the logged history
+        try:
+            from .history import main as history
+        except ImportError:
+            from history import main as history
+        return history(sys.argv[2:])
+    started = time.perf_counter()
+    metrics.REGISTRY.reset()
     args = parse_args()
+    settings()  # fail fast on a missing API key, before reading any input
+    try:
+        from .cache_store import ResponseCache
+        from .city_index import CityIndex
+        from .log_store import WeatherLog, log_row
+    except ImportError:
+        from cache_store import ResponseCache
+        from city_index import CityIndex
+        from log_store import WeatherLog, log_row
+
     logger = setup_logging()
     logger.info("run units=%s timeout=%s retries=%s backoff=%s cities=%s",
                 args.units, args.timeout, args.retries, args.backoff, args.cities)
 
-    # base session/timeout (used for sequential path)
-    session = make_session(total=args.retries, backoff=args.backoff)
     timeout = args.timeout
 
-    # merge cities from file + positional
-    cities = list(args.cities)
-    if args.cities_file:
-        with open(Path(args.cities_file), "r", encoding="utf-8") as f:
-            cities.extend([line.strip() for line in f if line.strip()])
-    if not cities:
-        cities = [input("Enter a city: ").strip()]
-
-    # optional CSV writer (respects CSV_OUT)
-    writer = None
-    existing = set()
+    # merge cities from file + positional (read lazily; only a few are peeked
+    # at to size the pool, so huge files never sit in memory)
+    cities = iter_cities(args.cities, args.cities_file)
+    head = list(islice(cities, ASYNC_WORKERS))
+    if not head:
+        head = [input("Enter a city: ").strip()]
+    cities = chain(head, cities)
+
+    # optional CSV log (respects CSV_OUT); de-dupe via its (date, city) index
+    log = WeatherLog(args.csv_out) if args.csv_out else None
+    rows = []
     today = datetime.date.today().isoformat()
-    if args.csv_out:
-        out_path = Path(args.csv_out)
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        need_header = not out_path.exists()
-
-        if out_path.exists():
-            with out_path.open("r", encoding="utf-8", newline="") as rf:
-                for row in csv.DictReader(rf):
-                    d, c = row.get("date"), row.get("city")
-                    if d and c:
-                        existing.add((d, c))
-
-        f = out_path.open("a", newline="", encoding="utf-8")
-        writer = csv.DictWriter(f, fieldnames=[
-            "date","city","temp","units","humidity","feels_like","conditions"
-        ])
-        if need_header:
-            writer.writeheader()
-
-        def write_unique_row(payload: dict):
-            key = (today, payload["city"])
-            if key in existing:
-                logger.info("skip duplicate row %s %s", *key)
-                return
-            writer.writerow({
-                "date": today,
-                "city": payload["city"],
-                "temp": payload["temp"],
-                "units": payload["units"],
-                "humidity": payload["humidity"],
-                "feels_like": payload["feels_like"],
-                "conditions": payload["conditions"],
-            })
-            existing.add(key)
+
+    def flush_rows():
+        with metrics.timed("weather_csv_write_seconds"):
+            results = log.append_many(rows)
+        for row, written in zip(rows, results):
+            metrics.inc("weather_csv_rows_total", result="written" if written else "duplicate")
+            if not written:
+                logger.info("skip duplicate row %s %s", row["date"], row["city"])
+        rows.clear()
 
     # ---------- parallel/caching decision (once) ----------
-    max_workers = args.max_workers or min(max(1, len(cities)), 8)
-    use_cache = bool(args.cache_day)
-
-    # fetch all cities (parallel or sequential)
-    if max_workers > 1:
-        results = fetch_parallel(cities, args.units, args.retries, args.backoff, timeout, use_cache)
-    else:
-        results = []
-        for city in cities:
-            payload = fetch_raw(city, args.units, session, timeout)
-            results.append((city, payload))
-
-    # print/log/write in input order
-    for city_input, payload in results:
+    mode, max_workers = _resolve_mode(args.mode, len(head), args.max_workers)
+    client = None if args.no_daemon else _daemon_client(args, logger)
+    # a running daemon has its own hot cache: the SQLite one is only opened without it
+    cache = (ResponseCache(ttl=args.cache_ttl, max_entries=args.cache_max, stale=args.cache_stale)
+             if args.cache and not client else None)
+
+    # one throttle shared by every worker: --rpm token bucket, Retry-After
+    # pauses everyone, and in-flight requests shrink on 429/5xx (AIMD)
+    rate_limit.configure(rpm=args.rpm, burst=args.burst, max_concurrency=max_workers, backoff=args.backoff)
+    # stragglers: past the hedge delay a second copy goes out, within --hedge-budget
+    hedge.configure(args.hedge, args.hedge_budget)
+    # fetched + cached in one unit system whatever --units says; converted in emit()
+    fetch = _engine(mode, CANONICAL_UNITS, args.retries, args.backoff, timeout, cache, max_workers)
+    if client:
+        logger.info("using daemon at %s", client.url)
+        direct = fetch
+        # no older than our own --cache would allow; without --cache, nothing cached at all
+        max_age = args.cache_ttl if args.cache else 0
+        fetch = lambda queries: iter_daemon(queries, CANONICAL_UNITS, client, direct, max_age)
+
+    streaming = args.stream or args.ordered
+    emitted = 0
+
+    def emit(city_input, payload):
+        """print/log one result; while streaming, its CSV row goes out right away too."""
+        nonlocal emitted
+        emitted += 1
+        payload = payload.to_units(args.units)
+        metrics.inc("weather_results_total", outcome="ok" if payload.get("ok") else payload["error"].split(":")[0])
         if args.json:
-            print(json.dumps({"date": today, **payload}, ensure_ascii=False))
+            print(json.dumps({"date": today, **payload}, ensure_ascii=False), flush=streaming)
             logger.info(payload if payload.get("ok") else f"ERR {payload}")
         else:
-            if payload.get("ok"):
-                msg = f"{payload['city']}: {payload['temp']:.2f}{unit_label(args.units)}, Humidity {payload['humidity']}%"
-            else:
-                err = payload.get("error", "unknown")
-                city = payload.get("city", city_input)
-                if err == "not found":
-                    msg = f"{city}: not found (check spelling)"
-                elif err == "auth":
-                    msg = "Auth error: check OPENWEATHER_API_KEY in week2/.env"
-                elif err.startswith("server"):
-                    code = err.split()[-1]
-                    msg = f"Temporary server issue ({code}). Please try again."
-                elif err.startswith("network"):
-                    msg = f"Network error for {city}: {err.split(':',1)[-1].strip()}"
-                else:
-                    msg = f"Error: {err}"
-            print(msg)
+            msg = format_line(city_input, payload, args.units)
+            print(msg, flush=streaming)
             logger.info(msg)
 
-        # CSV write (once)
-        if writer and payload.get("ok"):
-            write_unique_row(payload)
-
-    if writer:
-        f.close()
+        if log and payload.get("ok"):
+            row = log_row(today, payload)
+            if not streaming:
+                rows.append(row)
+                if len(rows) >= CSV_BATCH:
+                    flush_rows()
+            else:
+                with metrics.timed("weather_csv_write_seconds"):
+                    written = log.append(row)
+                metrics.inc("weather_csv_rows_total", result="written" if written else "duplicate")
+                if not written:
+                    logger.info("skip duplicate row %s %s", row["date"], row["city"])
+
+    # --stream: completion order. Otherwise input order via a reorder buffer:
+    # a line goes out as soon as every earlier city has (--ordered additionally
+    # flushes each line and CSV row at once; by default CSV rows go in batches).
+    # The buffer holds at most REORDER_MAX results: past that, the cities still
+    # holding it up lose their turn and print whenever they land.
+    buffer, next_idx = {}, 0
+    index = CityIndex()
+    try:
+        for idx, city, payload in iter_unique(fetch, cities, index):
+            if (args.stream and not args.ordered) or idx < next_idx:
+                emit(city, payload)
+                continue
+            buffer[idx] = (city, payload)
+            while next_idx in buffer or len(buffer) > REORDER_MAX:
+                if next_idx in buffer:
+                    emit(*buffer.pop(next_idx))
+                else:
+                    metrics.inc("weather_reorder_skips_total")
+                    logger.info("reorder buffer full: input #%s prints out of order", next_idx)
+                next_idx += 1
+    finally:
+        index.close()
+        if cache:
+            drain_refreshes()  # stale entries served above finish refreshing first
+            cache.close()  # prunes expired + LRU overflow
+        if log:
+            flush_rows()
+            log.close()
+        _export_metrics(args, started, emitted)
 
 if __name__ == "__main__":
     main()